@@ -1,21 +1,23 @@
 # app.py
 import streamlit as st
-import base64
 
-def add_bg_from_local(image_file):
-    with open(image_file, "rb") as image:
-        encoded_string = base64.b64encode(image.read()).decode()
-        page_bg_img = f"""
+import assets
+import metrics
+import warmup
+
+warmup.start()  # Once per process: load the pages and model in the background while the welcome page renders
+
+WELCOME_STYLE = """
     <style>
-    html, body, [data-testid="stApp"] {{
-        background-image: url("data:image/jpg;base64,{encoded_string}");
+    html, body, [data-testid="stApp"] {
+        background-image: url("{background_url}");
         background-size: cover;
         background-position: center;
         background-repeat: no-repeat;
         background-attachment: fixed;
         height: 100%;
-    }}
-    .title {{
+    }
+    .title {
         font-size: 45px;
         font-weight: bold;
         color: black;
@@ -23,8 +25,8 @@ def add_bg_from_local(image_file):
         margin-top: 5px; 
         margin-right: 80px;
         text-shadow: 2px 2px 4px #000000;
-    }}
-    .quote {{
+    }
+    .quote {
         font-size: 24px;
         font-style: italic;
         color: #f0f0f0;
@@ -33,8 +35,8 @@ def add_bg_from_local(image_file):
         margin-right: 20px;
         margin-bottom: 40px;
         text-shadow: 1px 1px 3px #000000;
-    }}
-    .stButton > button {{
+    }
+    .stButton > button {
         background-color: purple;
         color: white;
         font-size: 20px;
@@ -45,14 +47,17 @@ def add_bg_from_local(image_file):
         display: block;
         margin: auto;
         transition: 0.3s ease-in-out;
-    }}
-    .stButton > button:hover {{
+    }
+    .stButton > button:hover {
         background-color: pink;
         transform: scale(1.05);
-    }}
+    }
     </style>
     """
-    st.markdown(page_bg_img, unsafe_allow_html=True)
+
+def add_bg_from_local(image_file):
+    # The encoded CSS block is cached per process, so reruns don't re-read or re-encode the image
+    st.markdown(assets.background_style(image_file, WELCOME_STYLE), unsafe_allow_html=True)
 
 def welcome_page():
     add_bg_from_local("fff.jpg")
@@ -65,11 +70,12 @@ def welcome_page():
 if 'page' not in st.session_state:
     st.session_state.page = "welcome"
 
-if st.session_state.page == "welcome":
-    welcome_page()
-elif st.session_state.page == "test":
-    import test
-    test.prediction_page()
-elif st.session_state.page == "suggestion":
-    import suggestion
-    suggestion.suggestion_page()
\ No newline at end of file
+with metrics.rerun(st.session_state.page):  # No-op unless MATCHMINDS_METRICS / MATCHMINDS_PROFILE is set
+    if st.session_state.page == "welcome":
+        welcome_page()
+    elif st.session_state.page == "test":
+        import test
+        test.prediction_page()
+    elif st.session_state.page == "suggestion":
+        import suggestion
+        suggestion.suggestion_page()
\ No newline at end of file
@@ -0,0 +1,273 @@
+# artifacts.py
+# Process-wide, read-only registry for the trained model artifacts.
+#
+# Streamlit runs every browser session inside the same Python process, so the
+# model, scaler, member table, feature schema, cluster summary and assignment kernel are loaded once here and every
+# session gets the very same objects. Every few seconds the registry re-reads
+# models/CURRENT (see bundle.py) and hot-swaps to a newly published bundle once it
+# has been validated and loaded; without bundles it watches the artifact files in
+# the working directory and reloads them when their content hash changes.
+# The scaler and KMeans model are read from model_arrays.npz when it matches the
+# joblib files, so the serving path imports neither joblib, sklearn nor pandas.
+import hashlib  # Content hashes used as the artifact version
+import logging  # Rejected bundles
+import os  # File stats for change detection
+import resource  # Peak RSS of the process
+import threading  # Lock so concurrent sessions trigger a single load
+import time  # Load timings
+from dataclasses import dataclass, field  # Immutable artifact container
+from types import MappingProxyType  # Read-only views of the load metrics
+
+import metrics  # Opt-in latency histograms
+from bundle import MANIFEST, MODELS_DIR, BundleError, current_dir, validate  # Versioned model bundles
+from cluster_summary import SUMMARY_FILE, ClusterSummary  # Precomputed per-cluster statistics
+from kernel import KERNEL_FILE, AssignmentKernel  # Folded float32 assignment and scoring kernel
+from member_table import TABLE_DIR, MemberTable  # Memory-mapped member table
+from model_arrays import MODEL_ARRAYS, load_model_arrays  # sklearn-free export of the scaler and model
+from schema import QUESTIONNAIRE, SCHEMA_FILE, FeatureSchema  # Compiled feature schema and question bank
+
+# Files that make up one trained model, keyed by artifact name
+ARTIFACT_FILES = {
+    "members": os.path.join(TABLE_DIR, "meta.json"),
+    "kmeans": "kmeans_model.joblib",
+    "scaler": "scaler.joblib",
+    "schema": SCHEMA_FILE,
+}
+
+MEMBERS_CSV = "clustered_friends.csv"  # Used when no member table was written
+CHECK_INTERVAL = 2.0  # Seconds between file change checks
+
+logger = logging.getLogger("matchminds.artifacts")
+
+
+@dataclass(frozen=True)
+class Artifacts:
+    """One consistent, shared set of loaded artifacts. Treat every field as read-only."""
+    members: MemberTable
+    kmeans: object
+    scaler: object
+    schema: FeatureSchema
+    summary: ClusterSummary
+    kernel: AssignmentKernel
+    version: str
+    load_seconds: MappingProxyType
+    nbytes: MappingProxyType
+    loaded_at: float
+    base_dir: str = "."  # Bundle (or flat) directory the artifacts were loaded from
+    _derived: dict = field(default_factory=dict, repr=False, compare=False)
+    _derived_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def derived(self, name, build):
+        """Return a structure computed once from these artifacts (e.g. a search index)."""
+        if name not in self._derived:
+            with self._derived_lock:
+                if name not in self._derived:
+                    self._derived[name] = build(self)
+        return self._derived[name]
+
+
+_lock = threading.Lock()
+_current = None  # Currently served Artifacts
+_source = None  # Bundle directory (or flat directory) _current was loaded from
+_rejected = None  # Last bundle that failed validation
+_stamps = None  # (mtime_ns, size) of every file when last checked
+_hashes = None  # Content hash of every file when last loaded
+_last_check = 0.0
+_load_count = 0
+
+
+def _path(name, base_dir):
+    path = os.path.join(base_dir, ARTIFACT_FILES[name])
+    if name == "members" and not os.path.exists(path):
+        return os.path.join(base_dir, MEMBERS_CSV)
+    if name == "schema" and not os.path.exists(path):
+        return os.path.join(base_dir, QUESTIONNAIRE)  # Compiled at load time from the scaler's features
+    return path
+
+
+def load_members(path):
+    """Memory-map the member table, or convert the clustered CSV if only that exists."""
+    if path.endswith(".json"):
+        return MemberTable.open(os.path.dirname(path))
+    import pandas as pd  # Only needed for the CSV fallback
+    return MemberTable.from_frame(pd.read_csv(path))
+
+
+def load_joblib(path):
+    import joblib  # Unpickling imports scikit-learn; only used when model_arrays.npz is missing or stale
+    return joblib.load(path)
+
+
+def _file_stamps(base_dir):
+    stamps = {}
+    for name in ARTIFACT_FILES:
+        st_ = os.stat(_path(name, base_dir))
+        stamps[name] = (st_.st_mtime_ns, st_.st_size)
+    return stamps
+
+
+def _file_hashes(base_dir):
+    hashes = {}
+    for name in ARTIFACT_FILES:
+        with open(_path(name, base_dir), "rb") as f:
+            hashes[name] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def _load(base_dir, hashes, version=None):
+    timings = {}
+    sizes = {}
+
+    def timed(name, loader, path=None):
+        start = time.perf_counter()
+        value = loader(path or _path(name, base_dir))
+        timings[name] = time.perf_counter() - start
+        metrics.observe(f"artifact_load:{name}", timings[name])
+        return value
+
+    members = timed("members", load_members)
+    sizes["members"] = sum(int(a.nbytes) for a in (members.features, members.clusters, members.gender_codes,
+                                                   members.names_blob, members.name_offsets))
+
+    arrays_path = os.path.join(base_dir, MODEL_ARRAYS)
+    arrays = None
+    if os.path.exists(arrays_path):
+        arrays = timed("model_arrays", lambda p: load_model_arrays(p, hashes), arrays_path)
+    if arrays is not None:
+        scaler, kmeans = arrays
+    else:
+        kmeans = timed("kmeans", load_joblib)
+        scaler = timed("scaler", load_joblib)
+
+    def read_schema(path):
+        if path.endswith(".json"):
+            return FeatureSchema.load(path)
+        return FeatureSchema.compile(scaler.feature_names_in_, path)
+
+    schema = timed("schema", read_schema)
+    summary = timed("summary", lambda p: ClusterSummary.load_or_build(p, members, kmeans.cluster_centers_),
+                    os.path.join(base_dir, SUMMARY_FILE))
+    kernel = timed("kernel", lambda p: AssignmentKernel.load_or_fold(p, hashes, scaler, kmeans, summary.centroid_cosine),
+                   os.path.join(base_dir, KERNEL_FILE))
+    for name in ("kmeans", "scaler", "schema"):
+        sizes[name] = os.path.getsize(_path(name, base_dir))  # Serialized size as an estimate
+
+    version = version or hashlib.sha256("".join(hashes[n] for n in sorted(hashes)).encode()).hexdigest()[:12]
+    return Artifacts(
+        members=members,
+        kmeans=kmeans,
+        scaler=scaler,
+        schema=schema,
+        summary=summary,
+        kernel=kernel,
+        version=version,
+        load_seconds=MappingProxyType(timings),
+        nbytes=MappingProxyType(sizes),
+        loaded_at=time.time(),
+        base_dir=base_dir,
+    )
+
+
+def load_bundle(bundle_dir):
+    """Validate a published bundle against its manifest and load it; raises BundleError."""
+    manifest = validate(bundle_dir)
+    try:
+        hashes = {name: manifest["files"][rel.replace(os.sep, "/")] for name, rel in ARTIFACT_FILES.items()}
+    except KeyError as exc:
+        raise BundleError(f"{bundle_dir}: bundle has no {exc}")
+    artifacts = _load(bundle_dir, hashes, version=manifest["version"])
+    if [str(f) for f in artifacts.scaler.feature_names_in_] != manifest["features"]:
+        raise BundleError(f"{bundle_dir}: scaler features differ from the manifest")
+    if len(artifacts.kmeans.cluster_centers_) != manifest["k"] or len(artifacts.members) != manifest["members"]:
+        raise BundleError(f"{bundle_dir}: model or member table differ from the manifest")
+    return artifacts
+
+
+def load_from(base_dir):
+    """Load a fresh, uncached set of artifacts from `base_dir` (benchmarks and tools)."""
+    if os.path.exists(os.path.join(base_dir, MANIFEST)):
+        return load_bundle(base_dir)
+    bundle_dir = current_dir(os.path.join(base_dir, MODELS_DIR))
+    if bundle_dir is not None:
+        return load_bundle(bundle_dir)
+    return _load(base_dir, _file_hashes(base_dir))
+
+
+def load_artifacts(base_dir="."):
+    """Return the shared Artifacts, loading or reloading them only when the files changed.
+
+    With published bundles (models/CURRENT) a new bundle is validated and loaded
+    completely before it replaces the served one, and a bundle that fails
+    validation is logged and skipped while the previous one keeps serving.
+    Without bundles the artifact files in `base_dir` are watched directly.
+    """
+    global _current, _source, _rejected, _stamps, _hashes, _last_check, _load_count
+    now = time.monotonic()
+    if _current is not None and now - _last_check < CHECK_INTERVAL:
+        return _current
+    with _lock:
+        if _current is not None and now - _last_check < CHECK_INTERVAL:
+            return _current
+        _last_check = now  # Other sessions keep the current set while this thread checks or loads
+        bundle_dir = current_dir(os.path.join(base_dir, MODELS_DIR))
+        if bundle_dir is not None:
+            if bundle_dir != _source and bundle_dir != _rejected:
+                try:
+                    loaded = load_bundle(bundle_dir)
+                except (BundleError, OSError) as exc:
+                    if _current is None:
+                        raise
+                    logger.error("not switching to %s: %s", bundle_dir, exc)
+                    _rejected = bundle_dir
+                else:
+                    _current, _source = loaded, bundle_dir  # Swap in the new set as one reference
+                    _load_count += 1
+            return _current
+        stamps = _file_stamps(base_dir)
+        if _current is None or stamps != _stamps or _source != base_dir:
+            hashes = _file_hashes(base_dir)
+            if _current is None or hashes != _hashes or _source != base_dir:
+                _current, _source = _load(base_dir, hashes), base_dir  # Swap in the new set as one reference
+                _load_count += 1
+            _hashes = hashes
+            _stamps = stamps
+        return _current
+
+
+def stats():
+    """Load timings and memory figures of the registry, for logging or a metrics page."""
+    current = _current
+    return {
+        "loaded": current is not None,
+        "version": current.version if current else None,
+        "source": _source,
+        "loads": _load_count,
+        "loaded_at": current.loaded_at if current else None,
+        "load_seconds": dict(current.load_seconds) if current else {},
+        "nbytes": dict(current.nbytes) if current else {},
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def _gauges():
+    """stats() as Prometheus gauges, see metrics.register_gauges."""
+    current = stats()
+    gauges = {
+        "matchminds_artifacts_loaded": ("Whether a set of artifacts is loaded.", [({}, int(current["loaded"]))]),
+        "matchminds_artifact_loads": ("Artifact sets loaded since the process started.", [({}, current["loads"])]),
+        "matchminds_process_peak_rss_bytes": ("Peak resident memory of the process.",
+                                              [({}, current["peak_rss_kb"] * 1024)]),
+    }
+    if current["loaded"]:
+        gauges["matchminds_artifact_info"] = ("Version and source of the loaded artifacts.",
+                                              [({"version": current["version"], "source": current["source"]}, 1)])
+        gauges["matchminds_artifact_loaded_at_seconds"] = ("Unix time the artifacts were loaded.",
+                                                           [({}, current["loaded_at"])])
+        gauges["matchminds_artifact_load_seconds"] = ("Load time of each artifact.",
+                                                      [({"artifact": k}, v) for k, v in current["load_seconds"].items()])
+        gauges["matchminds_artifact_bytes"] = ("Memory held by each artifact.",
+                                               [({"artifact": k}, v) for k, v in current["nbytes"].items()])
+    return gauges
+
+
+metrics.register_gauges(_gauges)
@@ -0,0 +1,91 @@
+# assets.py
+# Background image pipeline for the Streamlit pages.
+#
+# `python assets.py` resizes and recompresses the background photos to WebP at a
+# few target widths under static/. At runtime background_style() returns the page
+# CSS for an image, cached per process: when Streamlit static serving is enabled
+# (see .streamlit/config.toml) the CSS only references /app/static/<file>, which
+# the browser fetches once and revalidates with its ETag; otherwise the small
+# WebP is inlined as base64 instead of the original JPEG.
+import base64
+import functools
+import hashlib
+import json
+import os
+
+STATIC_DIR = "static"
+MANIFEST = os.path.join(STATIC_DIR, "manifest.json")  # Source hash of every built image
+BACKGROUNDS = ["fff.jpg", "friends.jpg", "friendss.jpg"]
+WIDTHS = [1280, 1920]  # Target widths; images are never upscaled
+SERVED_WIDTH = 1920  # Width referenced by the CSS
+QUALITY = 75
+
+
+def built_path(image_file, width):
+    stem = os.path.splitext(os.path.basename(image_file))[0]
+    return os.path.join(STATIC_DIR, f"{stem}-{width}.webp")
+
+
+def build(images=BACKGROUNDS, widths=WIDTHS, quality=QUALITY, force=False):
+    """Write the WebP variants of every image that changed since the last build."""
+    from PIL import Image  # Build-time only dependency
+
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    manifest = {}
+    if os.path.exists(MANIFEST):
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+    written = []
+    for image_file in images:
+        with open(image_file, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        outputs = [built_path(image_file, width) for width in widths]
+        if not force and manifest.get(image_file) == digest and all(os.path.exists(out) for out in outputs):
+            continue
+        with Image.open(image_file) as im:
+            im = im.convert("RGB")
+            for width, out in zip(widths, outputs):
+                height = round(im.height * min(width, im.width) / im.width)
+                im.resize((min(width, im.width), height), Image.LANCZOS).save(out, "WEBP", quality=quality, method=6)
+                written.append((out, os.path.getsize(out)))
+        manifest[image_file] = digest
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return written
+
+
+def _static_serving_enabled():
+    try:
+        import streamlit as st
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=16)
+def _background_url(image_file, mtime, static_serving):
+    built = built_path(image_file, SERVED_WIDTH)
+    if os.path.exists(built):
+        if static_serving:
+            return f"app/static/{os.path.basename(built)}"
+        with open(built, "rb") as f:
+            return "data:image/webp;base64," + base64.b64encode(f.read()).decode()
+    with open(image_file, "rb") as f:  # Not built yet: fall back to the original file
+        return "data:image/jpg;base64," + base64.b64encode(f.read()).decode()
+
+
+@functools.lru_cache(maxsize=16)
+def _render(template, url):
+    return template.replace("{background_url}", url)
+
+
+def background_style(image_file, template):
+    """`template` with {background_url} filled in; encoded once per image version and process."""
+    url = _background_url(image_file, os.path.getmtime(image_file), _static_serving_enabled())
+    return _render(template, url)
+
+
+if __name__ == "__main__":
+    for path, size in build():
+        print(f"{path}: {size / 1024:.0f} KB")
+    print("Background images are up to date.")
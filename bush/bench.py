@@ -0,0 +1,163 @@
+# bench.py
+# Reproducible benchmarks for training, artifact loading, scoring and suggestions.
+#
+#   python bench.py                                  # default scales, writes bench_results.json
+#   python bench.py --scales 1000 100000 10000000    # up to 10M synthetic rows
+#   python bench.py --save-baseline                  # store the results as bench_baseline.json
+#   python bench.py --baseline bench_baseline.json   # compare, exit 1 on regressions
+#
+# Synthetic members are drawn column by column from the empirical answer
+# distribution of 'dataset of friendship compatibility.csv', with a fixed seed.
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import friend
+
+RESULTS_FILE = "bench_results.json"
+BASELINE_FILE = "bench_baseline.json"
+REGRESSION_THRESHOLD = 0.10  # Slower than the baseline by more than 10% is a regression
+IN_MEMORY_LIMIT = 1_000_000  # Larger scales are only trained in streaming mode
+
+
+def synthesize(n, path, seed=42, chunk=500_000):
+    """Write `n` synthetic rows with the schema of the training export."""
+    source = pd.read_csv(friend.DATASET)
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for col in source.columns:
+        counts = source[col].dropna().value_counts(normalize=True)
+        columns[col] = (counts.index.to_numpy(), counts.to_numpy())
+    for start in range(0, n, chunk):
+        size = min(chunk, n - start)
+        data = {}
+        for col, (values, p) in columns.items():
+            if col == 'Full Name ':
+                data[col] = [f"Member {i}" for i in range(start, start + size)]
+            else:
+                data[col] = values[rng.choice(len(values), size=size, p=p)]
+        pd.DataFrame(data, columns=source.columns).to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+
+
+def timeit(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"seconds": statistics.median(times), "min": min(times), "repeats": repeats}
+
+
+def bench_scale(n, workdir, repeats):
+    from artifacts import load_from
+    from candidates import CandidateIndex
+    from neighbours import MemberIndex
+    from scoring import Scorer
+
+    results = {}
+    data = os.path.join(workdir, f"members_{n}.csv")
+    synthesize(n, data)
+    out_dir = os.path.join(workdir, f"model_{n}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    if n <= IN_MEMORY_LIMIT:
+        results[f"train/in_memory/{n}"] = timeit(lambda: friend.train(data, out_dir, k=5, quiet=True), 1)
+    results[f"train/streaming/{n}"] = timeit(lambda: friend.train(data, out_dir, streaming=True, k=5, quiet=True), 1)
+
+    shutil.copy("questionnaire.csv", out_dir)
+    results[f"load/artifacts/{n}"] = timeit(lambda: load_from(out_dir), repeats)
+    artifacts = load_from(out_dir)
+    scorer = Scorer.from_artifacts(artifacts)
+    values = artifacts.members.feature_values(artifacts.scaler.feature_names_in_)[:10_000]
+    scaled = scorer.transform(values)
+
+    results[f"score/pair/{n}"] = timeit(lambda: [scorer.matrix(values[i:i + 1], values[i + 1:i + 2]) for i in range(100)], repeats)
+    m = min(1000, len(values))
+    results[f"score/matrix_{m}x{m}/{n}"] = timeit(lambda: scorer.matrix(values[:m], values[:m]), repeats)
+    results[f"score/top5_{len(values)}/{n}"] = timeit(lambda: [None for _ in scorer.top_k(values, values, 5)], 1)
+
+    results[f"suggest/index_build/{n}"] = timeit(lambda: CandidateIndex.from_artifacts(artifacts), 1)
+    index = CandidateIndex.from_artifacts(artifacts)
+    traits = ['Openness To Experience', 'Honesty', 'Respect', 'Family Values']
+    results[f"suggest/filter/{n}"] = timeit(lambda: [index.candidates(c, traits, "member 1") for c in range(5)], repeats)
+    members = MemberIndex(scorer.transform(artifacts.members.feature_values(artifacts.scaler.feature_names_in_)),
+                          artifacts.members.clusters, artifacts.kmeans.cluster_centers_)
+    rows = index.candidates(0, traits)
+    results[f"suggest/rank/{n}"] = timeit(lambda: members.rank(scaled[0], rows, k=5), repeats)
+    results[f"suggest/ivf_search/{n}"] = timeit(lambda: members.search(scaled[0], k=5, nprobe=2), repeats)
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print the change of every benchmark against the baseline; return the regressed names."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<40} {result['seconds']:>10.4f}s   (new)")
+            continue
+        change = result["seconds"] / base["seconds"] - 1 if base["seconds"] else 0.0
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"{name:<40} {result['seconds']:>10.4f}s   {change:+7.1%}  {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def environment():
+    import sklearn
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark training, loading, scoring and suggestions.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000], help="Synthetic member counts")
+    parser.add_argument("--repeats", type=int, default=5, help="Repeats of the fast benchmarks (median is reported)")
+    parser.add_argument("--out", default=RESULTS_FILE)
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also write the results to {BASELINE_FILE}")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="matchminds-bench-")
+    try:
+        for n in args.scales:
+            print(f"Benchmarking {n} members...")
+            results.update(bench_scale(n, workdir, args.repeats))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"environment": environment(), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    print(f"Results written to {args.out}")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
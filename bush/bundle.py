@@ -0,0 +1,219 @@
+# bundle.py
+# Versioned, immutable model bundles with a manifest and an atomic CURRENT pointer.
+#
+#   models/
+#     CURRENT                      name of the served bundle (replaced atomically)
+#     20261018-204512-3fa9c1d2/    one training run: every artifact plus manifest.json
+#       manifest.json              format, version, k, feature order, dataset fingerprint, sha256 of every file
+#       kmeans_model.joblib  scaler.joblib  model_arrays.npz  kernel.npz  feature_schema.json
+#       expected_features.json  clustered_friends.csv  member_table/  cluster_summary.npz
+#
+# friend.py, incremental.py and evaluate.py write into a staging directory and
+# publish() turns it into a bundle: manifest first, then a rename into place, then
+# the CURRENT swap. A bundle is never modified after publishing, so a server can
+# validate a new one completely, load it next to the old one and swap a single
+# reference (see artifacts.load_artifacts) with no restart and no mixed versions.
+# Bundles of manifest format 2 and later must carry the exported kernel, folded from
+# their own joblib files; older ones are still served with a kernel folded at load time.
+# The only files added later are caches built from the bundle while serving (the
+# neighbour index); they are left out of the manifest and of staging copies.
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+
+from kernel import KERNEL_FILE, AssignmentKernel
+from model_arrays import JOBLIB_FILES, MODEL_ARRAYS, load_model_arrays
+from neighbours import INDEX_FILE
+
+MODELS_DIR = "models"
+CURRENT = "CURRENT"
+MANIFEST = "manifest.json"
+KEEP_BUNDLES = 5  # Published bundles kept on disk, the current one always included
+CACHE_FILES = (INDEX_FILE,)  # Written into a bundle while serving, never part of it
+FORMAT = 2  # Manifest format written by publish(); 2 added the required kernel
+REQUIRED_FILES = (*JOBLIB_FILES.values(), MODEL_ARRAYS, KERNEL_FILE)
+
+
+class BundleError(ValueError):
+    pass
+
+
+def file_sha256(path, block=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dataset_fingerprint(path):
+    """sha256, size and row count of a training export."""
+    rows = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            rows += chunk.count(b"\n")
+    return {"path": os.path.basename(path), "sha256": file_sha256(path), "bytes": os.path.getsize(path), "rows": max(rows - 1, 0)}
+
+
+def _bundle_files(bundle_dir):
+    files = []
+    for root, dirs, names in os.walk(bundle_dir):
+        dirs.sort()
+        for name in sorted(names):
+            rel = os.path.relpath(os.path.join(root, name), bundle_dir).replace(os.sep, "/")
+            if rel != MANIFEST and rel not in CACHE_FILES:
+                files.append(rel)
+    return files
+
+
+def staging_dir(models_dir=MODELS_DIR):
+    """A fresh directory next to the bundles to write a training run into."""
+    path = os.path.join(models_dir, f".staging-{uuid.uuid4().hex[:12]}")
+    os.makedirs(path)  # Same file system as the bundles, so publishing is a rename
+    return path
+
+
+def stage_copy(models_dir=MODELS_DIR, copied=None):
+    """A staging copy of the current bundle, for updates that modify artifacts in place.
+
+    With `copied` (relative paths), only those files are copied and the others are
+    hard-linked, so the update must replace them (os.replace) instead of writing into them.
+    """
+    current = current_dir(models_dir)
+    if current is None:
+        raise BundleError(f"no current bundle in {models_dir}")
+    path = os.path.join(models_dir, f".staging-{uuid.uuid4().hex[:12]}")
+
+    def link(src, dst):
+        if os.path.relpath(src, current).replace(os.sep, "/") not in copied:
+            try:
+                os.link(src, dst)
+                return dst
+            except OSError:
+                pass  # No hard links on this file system
+        return shutil.copy2(src, dst)
+
+    shutil.copytree(current, path, ignore=shutil.ignore_patterns(MANIFEST, *CACHE_FILES),
+                    copy_function=shutil.copy2 if copied is None else link)
+    return path
+
+
+@contextmanager
+def staged(models_dir=MODELS_DIR, from_current=False, copied=None):
+    """Staging directory (empty, or a copy of the current bundle) that is removed again if the block fails."""
+    path = stage_copy(models_dir, copied) if from_current else staging_dir(models_dir)
+    try:
+        yield path
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+
+
+def publish(staged, models_dir=MODELS_DIR, dataset=None):
+    """Write the manifest of `staged`, move it into place as a new bundle and make it current. Returns its name."""
+    files = {rel: file_sha256(os.path.join(staged, rel)) for rel in _bundle_files(staged)}
+    for required in REQUIRED_FILES:
+        if required not in files:
+            raise BundleError(f"{staged} has no {required}")
+    hashes = {name: files[file] for name, file in JOBLIB_FILES.items()}  # What model_hashes() gives for the stage
+    if AssignmentKernel.load(os.path.join(staged, KERNEL_FILE), hashes) is None:
+        raise BundleError(f"{staged}: {KERNEL_FILE} was folded from other models")
+    scaler, kmeans = load_model_arrays(os.path.join(staged, MODEL_ARRAYS), hashes)
+    digest = hashlib.sha256("".join(f"{rel}:{h}" for rel, h in sorted(files.items())).encode()).hexdigest()
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{digest[:8]}"
+    with open(os.path.join(staged, "member_table", "meta.json")) as f:
+        members = json.load(f)["rows"]
+    manifest = {
+        "format": FORMAT,
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "k": int(kmeans.n_clusters),
+        "features": [str(f) for f in scaler.feature_names_in_],
+        "members": members,
+        "dataset": dataset_fingerprint(dataset) if dataset else None,
+        "files": files,
+    }
+    with open(os.path.join(staged, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    if os.path.exists(os.path.join(models_dir, version)):
+        shutil.rmtree(staged)  # Identical files published within the same second
+    else:
+        os.rename(staged, os.path.join(models_dir, version))
+    set_current(version, models_dir)
+    prune(models_dir)
+    return version
+
+
+def set_current(version, models_dir=MODELS_DIR):
+    """Point CURRENT at `version` with an atomic rename (also used to roll back)."""
+    validate(os.path.join(models_dir, version))
+    tmp = os.path.join(models_dir, f".{CURRENT}.{uuid.uuid4().hex[:8]}")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(models_dir, CURRENT))
+
+
+def current_dir(models_dir=MODELS_DIR):
+    """Directory of the current bundle, or None if there is none."""
+    try:
+        with open(os.path.join(models_dir, CURRENT)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(models_dir, name)
+
+
+def validate(bundle_dir):
+    """Check every file against the manifest; returns the manifest or raises BundleError."""
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as exc:
+        raise BundleError(f"{bundle_dir}: unreadable manifest ({exc})")
+    if manifest.get("format", 1) >= 2 and KERNEL_FILE not in manifest["files"]:
+        raise BundleError(f"{bundle_dir}: no {KERNEL_FILE} in the manifest")
+    for rel, expected in manifest["files"].items():
+        path = os.path.join(bundle_dir, rel)
+        if not os.path.exists(path):
+            raise BundleError(f"{bundle_dir}: missing {rel}")
+        if file_sha256(path) != expected:
+            raise BundleError(f"{bundle_dir}: {rel} does not match its manifest hash")
+    return manifest
+
+
+def prune(models_dir=MODELS_DIR, keep=KEEP_BUNDLES):
+    """Remove the oldest bundles beyond `keep`, never the current one."""
+    current = os.path.basename(current_dir(models_dir) or "")
+    bundles = sorted(d for d in os.listdir(models_dir)
+                     if not d.startswith(".") and os.path.isfile(os.path.join(models_dir, d, MANIFEST)))
+    for name in bundles[:-keep] if keep else bundles:
+        if name != current:
+            shutil.rmtree(os.path.join(models_dir, name), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, validate or roll back model bundles.")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("command", choices=["list", "validate", "use"])
+    parser.add_argument("version", nargs="?", help="Bundle to validate or make current")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        current = os.path.basename(current_dir(args.models_dir) or "")
+        for name in sorted(os.listdir(args.models_dir)):
+            if os.path.isfile(os.path.join(args.models_dir, name, MANIFEST)):
+                print(("* " if name == current else "  ") + name)
+    elif args.command == "validate":
+        bundle_dir = os.path.join(args.models_dir, args.version) if args.version else current_dir(args.models_dir)
+        manifest = validate(bundle_dir)
+        print(f"{manifest['version']}: {len(manifest['files'])} files OK, k={manifest['k']}, {len(manifest['features'])} features")
+    else:
+        set_current(args.version, args.models_dir)
+        print(f"CURRENT -> {args.version}")
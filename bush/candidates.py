@@ -0,0 +1,101 @@
+# candidates.py
+# Precomputed candidate index for the suggestion page.
+#
+# Built once per loaded member table (see artifacts.Artifacts.derived), so a page
+# view only slices arrays: members are grouped by cluster with row offsets, trait
+# answers above the threshold are kept as a boolean matrix and names are hashed
+# to their rows. Filtering a cluster costs O(cluster size) with no Python row loop,
+# and the per-cluster trait counts of cluster_summary.py answer "nobody matches" in O(1).
+# Row numbers are rows of the member table.
+import numpy as np  # NumPy for the index arrays
+
+from schema import feature_key  # Trait names match table columns by feature key
+
+TRAIT_THRESHOLD = 3  # Answers above this count as a significant trait
+
+
+class CandidateIndex:
+    def __init__(self, names, genders, clusters, trait_names, trait_values, threshold=TRAIT_THRESHOLD, summary=None):
+        self.names = np.asarray(names, dtype=object)  # Display names
+        self.genders = np.asarray(genders, dtype=object)
+        self.has_name = np.array([bool(n) for n in self.names], dtype=bool)  # Nameless rows are never suggested
+        self.threshold = threshold
+
+        # Members grouped by cluster: rows of cluster c are order[offsets[c]:offsets[c + 1]]
+        if summary is not None:  # Precomputed at training time (cluster_summary.py)
+            self.order, self.offsets = summary.order, summary.offsets
+            self.trait_counts = summary.trait_counts  # cluster x trait, members above the threshold
+        else:
+            clusters = np.asarray(clusters, dtype=np.int64)
+            self.order = np.argsort(clusters, kind="stable")
+            counts = np.bincount(clusters) if len(clusters) else np.zeros(0, dtype=np.int64)
+            self.offsets = np.concatenate([[0], np.cumsum(counts)])
+            self.trait_counts = None
+
+        # Boolean trait matrix, missing answers (NaN, or MISSING = -1 in the int8 table) never count as significant
+        self.trait_bits = np.asarray(trait_values) > threshold
+        self.trait_slots = {feature_key(name): i for i, name in enumerate(trait_names)}
+
+        # Lower-cased name -> rows holding it (names are not unique)
+        self.name_rows = {}
+        for row, name in enumerate(self.names):
+            self.name_rows.setdefault(name.lower(), []).append(row)
+
+    @classmethod
+    def from_table(cls, members, summary=None):
+        """Build the index from a member_table.MemberTable (and its cluster_summary.ClusterSummary)."""
+        return cls(
+            names=members.names(),
+            genders=members.gender_labels(),
+            clusters=members.clusters,
+            trait_names=members.columns,
+            trait_values=members.features,  # Compared as int8, no float copy of the table
+            summary=summary,
+        )
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        return cls.from_table(artifacts.members, artifacts.summary)
+
+    def trait_slot(self, trait):
+        """Matrix column of a trait, matched by feature_key; a name the table does not have is an error."""
+        try:
+            return self.trait_slots[feature_key(trait)]
+        except KeyError:
+            raise ValueError(f"unknown trait {trait!r}") from None
+
+    def trait_columns(self, traits):
+        """Matrix column of every trait."""
+        return np.array([self.trait_slot(t) for t in traits], dtype=np.int64)
+
+    def cluster_rows(self, cluster):
+        if cluster < 0 or cluster + 1 >= len(self.offsets):
+            return np.zeros(0, dtype=np.int64)
+        return self.order[self.offsets[cluster]:self.offsets[cluster + 1]]
+
+    def candidates(self, cluster, traits, exclude_name=""):
+        """Rows in `cluster` with at least one significant trait, excluding `exclude_name`."""
+        rows = self.cluster_rows(cluster)
+        cols = self.trait_columns(traits)
+        if len(cols) == 0:
+            return rows[:0]
+        if self.trait_counts is not None and len(rows) and not self.trait_counts[cluster, cols].any():
+            return rows[:0]  # Nobody in the cluster has any of these traits
+        keep = self.trait_bits[np.ix_(rows, cols)].any(axis=1) & self.has_name[rows]
+        excluded = self.name_rows.get(exclude_name.strip().lower())
+        if excluded:
+            keep &= ~np.isin(rows, excluded)
+        return rows[keep]
+
+    def matched_traits(self, row, traits):
+        """Significant traits of one member, in the order given."""
+        return [t for t in traits if self.trait_bits[row, self.trait_slot(t)]]
+
+
+def format_traits_as_sentence(matched_traits):
+    matched = [t.lower() for t in matched_traits]
+    if not matched:
+        return ""
+    if len(matched) == 1:
+        return f"You both have {matched[0]}."
+    return "You both have " + ", ".join(matched[:-1]) + f", and {matched[-1]}."
@@ -0,0 +1,109 @@
+# cluster_summary.py
+# Cluster-level statistics computed once at training time (cluster_summary.npz).
+#
+#   centroid_cosine  k x k cosine similarity of the KMeans centroids
+#   counts           members per cluster
+#   order, offsets   member-table rows grouped by cluster: rows of c are order[offsets[c]:offsets[c + 1]]
+#   trait_counts     k x traits, members whose answer is above TRAIT_THRESHOLD
+#   trait_means      k x traits, mean answer of the members who answered
+#
+# friend.py and incremental.py write it next to the member table. The artifact
+# registry checks it against the loaded table and centroids and recomputes it in
+# memory when it is missing or stale, so the pages only ever index into it.
+#
+#   python cluster_summary.py     # print the summary of the model in the current directory
+import os
+
+import numpy as np
+
+from candidates import TRAIT_THRESHOLD
+from member_table import MISSING, TABLE_DIR, MemberTable
+
+SUMMARY_FILE = "cluster_summary.npz"
+CHUNK_ROWS = 1 << 16  # Member-table rows read at a time while building
+
+
+def centroid_cosine(centers):
+    centers = np.asarray(centers, dtype=np.float64)
+    norms = np.linalg.norm(centers, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    unit = centers / norms
+    return unit @ unit.T
+
+
+class ClusterSummary:
+    def __init__(self, centers, counts, order, trait_names, trait_counts, trait_means, threshold=TRAIT_THRESHOLD):
+        self.centers = np.asarray(centers, dtype=np.float64)
+        self.centroid_cosine = centroid_cosine(self.centers)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        self.order = np.asarray(order, dtype=np.int64)
+        self.trait_names = list(trait_names)
+        self.trait_slots = {name: i for i, name in enumerate(self.trait_names)}
+        self.trait_counts = np.asarray(trait_counts, dtype=np.int64)
+        self.trait_means = np.asarray(trait_means, dtype=np.float64)
+        self.threshold = threshold
+
+    @classmethod
+    def build(cls, members, centers, threshold=TRAIT_THRESHOLD):
+        """One pass over a member_table.MemberTable, CHUNK_ROWS at a time."""
+        k = len(centers)
+        clusters = np.asarray(members.clusters, dtype=np.int64)
+        shape = (k, len(members.columns))
+        above, sums, answered = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+        for start in range(0, len(members), CHUNK_ROWS):
+            values = np.asarray(members.features[start:start + CHUNK_ROWS], dtype=np.float64)
+            valid = values != MISSING
+            onehot = (clusters[start:start + CHUNK_ROWS, None] == np.arange(k)).astype(np.float64).T  # k x chunk
+            above += onehot @ (valid & (values > threshold))
+            sums += onehot @ np.where(valid, values, 0.0)
+            answered += onehot @ valid
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(answered > 0, sums / answered, np.nan)
+        return cls(centers, np.bincount(clusters, minlength=k), np.argsort(clusters, kind="stable"),
+                   members.columns, above, means, threshold)
+
+    @classmethod
+    def load_or_build(cls, path, members, centers):
+        """The saved summary if it still describes `members` and `centers`, else a fresh one."""
+        if os.path.exists(path):
+            summary = cls.load(path)
+            if summary.describes(members, centers):
+                return summary
+        return cls.build(members, centers)
+
+    def describes(self, members, centers):
+        return (len(self.order) == len(members) and self.trait_names == list(members.columns)
+                and self.threshold == TRAIT_THRESHOLD and np.array_equal(self.centers, np.asarray(centers, dtype=np.float64)))
+
+    def save(self, path=SUMMARY_FILE):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centers=self.centers, counts=self.counts, order=self.order,
+                 trait_names=np.asarray(self.trait_names, dtype=str), trait_counts=self.trait_counts,
+                 trait_means=self.trait_means, threshold=self.threshold)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=SUMMARY_FILE):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["centers"], data["counts"], data["order"], data["trait_names"].tolist(),
+                       data["trait_counts"], data["trait_means"], data["threshold"].item())
+
+
+def write_summary(kmeans, out_dir='.'):
+    """Summarize the member table in `out_dir` for `kmeans` and save it next to the model."""
+    table = os.path.join(out_dir, TABLE_DIR)
+    if os.path.exists(os.path.join(table, 'meta.json')):
+        ClusterSummary.build(MemberTable.open(table), kmeans.cluster_centers_).save(os.path.join(out_dir, SUMMARY_FILE))
+
+
+if __name__ == "__main__":
+    from artifacts import load_artifacts
+
+    summary = load_artifacts().summary
+    for c, count in enumerate(summary.counts):
+        print(f"Cluster {c}: {count} members")
+        for t, name in enumerate(summary.trait_names):
+            print(f"  {name:<30} above {summary.threshold}: {summary.trait_counts[c, t]:>6}   mean {summary.trait_means[c, t]:.2f}")
+    print("Centroid cosine similarity:")
+    print(np.array2string(summary.centroid_cosine, precision=3))
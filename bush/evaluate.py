@@ -0,0 +1,195 @@
+# evaluate.py
+# Model selection for the clustering model: a grid over k, KMeans init and feature
+# subsets, evaluated in a process pool and ranked.
+#
+#   python evaluate.py                                   # default grid, writes evaluation_report.json
+#   python evaluate.py --k 3 4 5 6 --init k-means++ --subsets all no_age --bootstrap 20
+#   python evaluate.py --promote                         # retrain the best eligible config and publish it as a bundle
+#
+# The export first goes through the data-quality stage like in friend.py (quarantine.csv and
+# quality_report.json are written next to the report; --no-clean evaluates the raw export),
+# so the configurations are scored on, and the promoted model is fit to, the rows training uses.
+#
+# Every configuration is scored with
+#   silhouette       on a random sample of --sample-size rows (O(sample^2), not O(n^2))
+#   davies_bouldin   on all rows (O(n k))
+#   stability        mean adjusted Rand index between the full fit and fits on
+#                    --bootstrap subsamples, compared on the silhouette sample
+# and ranked by the mean of its ranks on the three scores. Scores of different
+# feature subsets are not strictly comparable (fewer dimensions separate more easily),
+# so subsets are best read as a diagnostic. Only configurations that use every
+# model feature can be promoted: the model is refit on all of them, and the app
+# scores all of them (age included, though the questionnaire does not ask it).
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.metrics import adjusted_rand_score, davies_bouldin_score, silhouette_score
+from sklearn.preprocessing import StandardScaler
+
+import friend
+from bundle import MODELS_DIR, publish, staged
+from quality import CLEANED_FILE, QUARANTINE_FILE, REPORT_FILE as QUALITY_REPORT, QualityError, clean as clean_export
+from schema import feature_key
+
+REPORT_FILE = "evaluation_report.json"
+INITS = ("k-means++", "random")
+N_INIT = 4  # KMeans restarts per fit
+SUBSAMPLE = 0.8  # Fraction of rows in every bootstrap fit
+
+# Feature subsets by feature key; None means every numeric column
+FEATURE_SUBSETS = {
+    "all": None,
+    "no_age": lambda key: key != "age",
+    "values": lambda key: key in {"openness to experience", "extraversion", "neuroticism", "honesty", "loyality",
+                                  "respect", "family values", "open mindedness"},
+    "social": lambda key: key in {"hangout routine", "use ofsocial media", "public speaking", "friendhip initiations",
+                                  "hanging out with friends"},
+}
+
+_data = None  # Scaled matrix of the worker process, set once by _init_worker
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def subset_columns(features, subset):
+    """Column indices of `features` in the named subset."""
+    keep = FEATURE_SUBSETS[subset]
+    return [i for i, f in enumerate(features) if keep is None or keep(feature_key(f))]
+
+
+def evaluate_config(config, sample_size, bootstrap, seed=42):
+    """Fit one (k, init, subset columns) configuration on the worker's data and score it."""
+    k, init, subset, columns = config
+    x = _data[:, columns]
+    rng = np.random.default_rng(seed)
+    model = KMeans(n_clusters=k, init=init, n_init=N_INIT, random_state=seed).fit(x)
+    labels = model.labels_
+    sample = rng.choice(len(x), size=min(sample_size, len(x)), replace=False)
+    result = {"k": k, "init": init, "subset": subset, "features": len(columns), "inertia": float(model.inertia_)}
+    if len(set(labels)) < 2:
+        return {**result, "silhouette": -1.0, "davies_bouldin": float("inf"), "stability": 0.0}
+    result["silhouette"] = float(silhouette_score(x[sample], labels[sample]))
+    result["davies_bouldin"] = float(davies_bouldin_score(x, labels))
+    scores = []
+    for b in range(bootstrap):
+        rows = rng.choice(len(x), size=max(k, int(len(x) * SUBSAMPLE)), replace=False)
+        refit = KMeans(n_clusters=k, init=init, n_init=N_INIT, random_state=seed + b + 1).fit(x[rows])
+        scores.append(adjusted_rand_score(labels[sample], refit.predict(x[sample])))
+    result["stability"] = float(np.mean(scores)) if scores else float("nan")
+    return result
+
+
+def rank(results):
+    """Sort by the mean rank on silhouette (high), Davies-Bouldin (low) and stability (high)."""
+    n = len(results)
+    order = {
+        "silhouette": sorted(range(n), key=lambda i: -results[i]["silhouette"]),
+        "davies_bouldin": sorted(range(n), key=lambda i: results[i]["davies_bouldin"]),
+        "stability": sorted(range(n), key=lambda i: -np.nan_to_num(results[i]["stability"], nan=-1.0)),
+    }
+    for metric, indices in order.items():
+        for position, i in enumerate(indices):
+            results[i].setdefault("ranks", {})[metric] = position + 1
+    for r in results:
+        r["score_rank"] = float(np.mean(list(r["ranks"].values())))
+    return sorted(results, key=lambda r: (r["score_rank"], -r["silhouette"]))
+
+
+def load_scaled(path, clean=True, quality_dir="."):
+    """Training export as (DataFrame, features, fitted scaler, scaled matrix), prepared like friend.py does.
+
+    With `clean`, only the rows quality.clean keeps are used; its quarantine and report go to `quality_dir`.
+    """
+    if clean:
+        cleaned = os.path.join(quality_dir, CLEANED_FILE)
+        try:
+            clean_export(path, cleaned, os.path.join(quality_dir, QUARANTINE_FILE), os.path.join(quality_dir, QUALITY_REPORT))
+            df = pd.read_csv(cleaned)
+        finally:
+            if os.path.exists(cleaned):
+                os.remove(cleaned)
+    else:
+        df = pd.read_csv(path)
+    features = friend.numeric_columns(df)
+    values = df[features].fillna(df[features].mean())
+    scaler = StandardScaler()
+    return df, features, scaler, scaler.fit_transform(values)
+
+
+def run(path, k_range, inits, subsets, sample_size, bootstrap, workers, clean=True, quality_dir="."):
+    df, features, scaler, scaled = load_scaled(path, clean, quality_dir)
+    configs = [(k, init, subset, subset_columns(features, subset)) for subset in subsets for init in inits for k in k_range]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scaled,)) as pool:
+        futures = [pool.submit(evaluate_config, c, sample_size, bootstrap) for c in configs]
+        results = [f.result() for f in futures]
+    return df, features, scaler, scaled, rank(results)
+
+
+def promote(best, df, features, scaler, scaled, out_dir='.'):
+    """Refit the chosen configuration on all features and write it as the app's model."""
+    kmeans = KMeans(n_clusters=best["k"], init=best["init"], n_init=N_INIT, random_state=42).fit(scaled)
+    df['Cluster'] = kmeans.labels_
+    friend.save_artifacts(df, features, scaler, kmeans, out_dir)
+    return kmeans
+
+
+def eligible(result, features):
+    """Whether a configuration uses every model feature, i.e. was evaluated exactly as promote() refits it."""
+    return len(subset_columns(features, result["subset"])) == len(features)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate clustering configurations and optionally promote the best.")
+    parser.add_argument("--data", default=friend.DATASET, help="CSV export to evaluate on")
+    parser.add_argument("--k", type=int, nargs="+", default=list(friend.K_RANGE))
+    parser.add_argument("--init", nargs="+", default=list(INITS), choices=INITS)
+    parser.add_argument("--subsets", nargs="+", default=list(FEATURE_SUBSETS), choices=list(FEATURE_SUBSETS))
+    parser.add_argument("--sample-size", type=int, default=2000, help="Rows for silhouette and stability")
+    parser.add_argument("--bootstrap", type=int, default=10, help="Subsample refits for the stability score")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=REPORT_FILE)
+    parser.add_argument("--promote", action="store_true", help="Retrain the best eligible configuration and publish it as a bundle")
+    parser.add_argument("--models-dir", default=MODELS_DIR, help="Where the promoted bundle is published")
+    parser.add_argument("--out-dir", default=None, help="Write the promoted artifacts into this directory instead of a bundle")
+    parser.add_argument("--no-clean", action="store_true", help="Evaluate the export as is, without the data-quality stage")
+    args = parser.parse_args()
+
+    quality_dir = os.path.dirname(os.path.abspath(args.out))
+    try:
+        df, features, scaler, scaled, results = run(args.data, args.k, args.init, args.subsets, args.sample_size,
+                                                    args.bootstrap, args.workers, not args.no_clean, quality_dir)
+    except QualityError as exc:
+        raise SystemExit(f"Data quality check failed: {exc}")
+    print(f"{'#':>3} {'k':>3} {'init':<10} {'subset':<8} {'silhouette':>10} {'davies_b.':>10} {'stability':>10} {'rank':>6}")
+    for i, r in enumerate(results, 1):
+        print(f"{i:>3} {r['k']:>3} {r['init']:<10} {r['subset']:<8} {r['silhouette']:>10.4f} "
+              f"{r['davies_bouldin']:>10.4f} {r['stability']:>10.4f} {r['score_rank']:>6.1f}")
+    best = next((r for r in results if eligible(r, features)), None)
+    with open(args.out, "w") as f:
+        json.dump({"data": os.path.abspath(args.data), "rows": len(df), "best_eligible": best, "results": results}, f, indent=2)
+    if best is not None:
+        print(f"Best eligible: k={best['k']} init={best['init']} subset={best['subset']}")
+    print(f"Report written to {args.out}")
+
+    if args.promote:
+        if best is None:
+            raise SystemExit("No evaluated configuration uses every model feature; nothing promoted.")
+        if args.out_dir:
+            promote(best, df, features, scaler, scaled, args.out_dir)
+            target = args.out_dir
+        else:
+            with staged(args.models_dir) as stage:
+                promote(best, df, features, scaler, scaled, stage)
+                if not args.no_clean:
+                    shutil.copyfile(os.path.join(quality_dir, QUALITY_REPORT), os.path.join(stage, QUALITY_REPORT))
+                target = publish(stage, args.models_dir, dataset=args.data)
+        print(f"Promoted k={best['k']} init={best['init']} to {target}")
@@ -1,58 +1,286 @@
-import pandas as pd
-import numpy as np
+import argparse  # Command line options for the training modes
+import json
+import os
+import resource  # Peak memory per stage
+import shutil
+import time  # Per-stage timings
+from concurrent.futures import ProcessPoolExecutor  # Parallel k-sweep
+from contextlib import contextmanager
+from functools import partial
+
 import joblib
-from sklearn.cluster import KMeans
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
 from sklearn.preprocessing import StandardScaler
-import json
 
-# Load the dataset
-file_path = 'dataset of friendship compatibility.csv'
-df = pd.read_csv(file_path)
+from bundle import MODELS_DIR, publish, staged
+from cluster_summary import write_summary
+from kernel import DTYPES as KERNEL_DTYPES, export_kernel
+from member_table import TABLE_DIR, MemberTableWriter
+from model_arrays import save_model_arrays
+from quality import CLEANED_FILE, QUARANTINE_FILE, REPORT_FILE, QualityError, clean as clean_export
+from schema import QUESTIONNAIRE, SCHEMA_FILE, FeatureSchema
+
+DATASET = 'dataset of friendship compatibility.csv'
+DROP_COLUMNS = ['Full Name', 'Gender']  # Unwanted columns, dropped if they exist
+DEFAULT_K = 5  # Used when k is not chosen automatically
+K_RANGE = range(2, 11)
+
+
+class StageTimer:
+    """Records wall time and peak memory of each training stage."""
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        yield
+        self.stages.append({
+            "stage": name,
+            "seconds": round(time.perf_counter() - start, 4),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "peak_worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        })
+
+    def report(self):
+        for s in self.stages:
+            print(f"{s['stage']:<16} {s['seconds']:>9.3f}s   peak RSS {s['peak_rss_mb']:>8.1f} MB   workers {s['peak_worker_rss_mb']:>8.1f} MB")
+
+
+def numeric_columns(df):
+    df_cleaned = df.drop(columns=[col for col in DROP_COLUMNS if col in df.columns], errors='ignore')
+    return list(df_cleaned.select_dtypes(include=[np.number]).columns)
+
+
+def impute_and_scale(chunk, features, mean, scale):
+    """Mean-impute missing values and standardize, i.e. StandardScaler.transform after fillna."""
+    values = chunk[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    values = np.where(np.isnan(values), mean, values)
+    return (values - mean) / scale
+
+
+def choose_k(results):
+    """Pick the k with the best silhouette score on the sample."""
+    return max(results, key=lambda r: r["silhouette"])["k"]
+
+
+def _fit_full_k(scaled_data, sample_size, k):
+    model = KMeans(n_clusters=k, random_state=42)
+    model.fit(scaled_data)
+    silhouette = silhouette_score(scaled_data, model.labels_, sample_size=min(sample_size, len(scaled_data)), random_state=42)
+    return {"k": k, "inertia": float(model.inertia_), "silhouette": float(silhouette), "model": model}
+
+
+def _fit_streaming_k(path, features, mean, scale, sample, chunksize, batch_size, epochs, k):
+    # Start from a full KMeans on the in-memory sample, then refine with mini-batches over the whole file
+    init = KMeans(n_clusters=k, random_state=42).fit(sample).cluster_centers_
+    model = MiniBatchKMeans(n_clusters=k, init=init, n_init=1, batch_size=batch_size, random_state=42)
+    for _ in range(epochs):
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            scaled = impute_and_scale(chunk, features, mean, scale)
+            for start in range(0, len(scaled), batch_size):
+                model.partial_fit(scaled[start:start + batch_size])
+    labels = model.predict(sample)
+    silhouette = silhouette_score(sample, labels) if len(set(labels)) > 1 else -1.0
+    inertia = float(((sample - model.cluster_centers_[labels]) ** 2).sum())  # On the sample
+    return {"k": k, "inertia": inertia, "silhouette": float(silhouette), "model": model}
+
+
+def sweep_k(fit, k_range, workers):
+    """Fit one model per k in a process pool; `fit` takes k as its last argument."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fit, k_range))
+
+
+def _reservoir_update(sample, values, seen, size, rng):
+    """Keep a uniform random sample of at most `size` rows over a stream of chunks."""
+    if len(sample) < size:
+        take = size - len(sample)
+        sample = np.vstack([sample, values[:take]])
+        seen += len(values[:take])
+        values = values[take:]
+    if len(values):
+        slots = rng.integers(0, seen + 1 + np.arange(len(values)))  # Row i replaces a slot with probability size / (seen + i + 1)
+        keep = slots < size
+        sample[slots[keep]] = values[keep]
+        seen += len(values)
+    return sample, seen
+
+
+def train_in_memory(path, k, timer, sample_size, workers, k_range=K_RANGE):
+    """Original mode: whole CSV in pandas, full KMeans."""
+    with timer("load"):
+        df = pd.read_csv(path)
+        features = numeric_columns(df)
+        df_numeric = df[features]
+
+        # Handle missing values if any
+        if df_numeric.isna().sum().sum() > 0:
+            df_numeric = df_numeric.fillna(df_numeric.mean())
+
+    with timer("scale"):
+        scaler = StandardScaler()
+        scaled_data = scaler.fit_transform(df_numeric)
+
+    sweep = []
+    if k == "auto":
+        with timer("k-sweep"):
+            sweep = sweep_k(partial(_fit_full_k, scaled_data, sample_size), k_range, workers)
+            k = choose_k(sweep)
+        kmeans = next(r["model"] for r in sweep if r["k"] == k)
+    else:
+        with timer("fit"):
+            kmeans = KMeans(n_clusters=k, random_state=42)
+            kmeans.fit(scaled_data)
+
+    with timer("assign"):
+        # Assign clusters back to original dataframe
+        df['Cluster'] = kmeans.labels_
+    return df, features, scaler, kmeans, sweep
+
+
+def train_streaming(path, k, timer, sample_size, workers, chunksize, batch_size=1024, epochs=3, k_range=K_RANGE, out_dir='.'):
+    """Chunked mode: constant memory in the CSV size, MiniBatchKMeans refined over the stream."""
+    rng = np.random.default_rng(42)
+    scaler = StandardScaler()
+    features = None
+    sample = None  # Uniform sample of raw feature rows, for initialisation and k selection
+    seen = 0
+    with timer("scan + scaler"):
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            if features is None:
+                features = numeric_columns(chunk)
+                sample = np.empty((0, len(features)))
+            values = chunk[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+            scaler.partial_fit(values)  # NaN values are ignored by the running statistics
+            sample, seen = _reservoir_update(sample, values, seen, sample_size, rng)
+        sample = np.where(np.isnan(sample), scaler.mean_, sample)
+        sample = (sample - scaler.mean_) / scaler.scale_
+    scaler.feature_names_in_ = np.asarray(features, dtype=object)
+
+    fit = partial(_fit_streaming_k, path, features, scaler.mean_, scaler.scale_, sample, chunksize, batch_size, epochs)
+    sweep = []
+    if k == "auto":
+        with timer("k-sweep"):
+            sweep = sweep_k(fit, k_range, workers)
+            k = choose_k(sweep)
+        kmeans = next(r["model"] for r in sweep if r["k"] == k)
+    else:
+        with timer("fit"):
+            kmeans = fit(k)["model"]
+
+    with timer("assign + write"):
+        table = MemberTableWriter(os.path.join(out_dir, TABLE_DIR), features)
+        for i, chunk in enumerate(pd.read_csv(path, chunksize=chunksize)):
+            chunk['Cluster'] = kmeans.predict(impute_and_scale(chunk, features, scaler.mean_, scaler.scale_))
+            chunk.to_csv(os.path.join(out_dir, 'clustered_friends.csv'), mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            table.write(chunk, chunk['Cluster'])
+        table.close()
+    return None, features, scaler, kmeans, sweep
+
 
-# Drop unwanted columns if they exist
-drop_columns = ['Full Name', 'Gender']
-df_cleaned = df.drop(columns=[col for col in drop_columns if col in df.columns], errors='ignore')
+def save_artifacts(df, features, scaler, kmeans, out_dir='.', kernel="float32"):
+    # Save clustered data, as CSV and as the memory-mapped member table (the streaming mode writes both while assigning)
+    if df is not None:
+        df.to_csv(os.path.join(out_dir, 'clustered_friends.csv'), index=False)
+        table = MemberTableWriter(os.path.join(out_dir, TABLE_DIR), features)
+        table.write(df, df['Cluster'])
+        table.close()
 
-# Select only numeric columns for processing
-numeric_cols = df_cleaned.select_dtypes(include=[np.number]).columns
-df_numeric = df_cleaned[numeric_cols]
+    # Save model and scaler for later use
+    joblib.dump(kmeans, os.path.join(out_dir, 'kmeans_model.joblib'))
+    joblib.dump(scaler, os.path.join(out_dir, 'scaler.joblib'))
+    save_model_arrays(scaler, kmeans, out_dir)  # Plain-array copy so serving never unpickles sklearn
+    write_summary(kmeans, out_dir)  # Centroid similarities and per-cluster counts for O(1) lookups
+    # Scaler folded into the centroids, checked against KMeans.predict on the training rows
+    export_kernel(scaler, kmeans, out_dir, kernel, None if df is None else df[features].to_numpy(dtype=np.float64))
 
-# Handle missing values if any
-if df_numeric.isna().sum().sum() > 0:
-    df_numeric.fillna(df_numeric.mean(), inplace=True)
+    # Save the list of features expected by the UI (cleaned column names)
+    expected_features = [col.strip().lower() for col in features]
+    with open(os.path.join(out_dir, 'expected_features.json'), 'w') as f:
+        json.dump(expected_features, f)
 
-# Scale the numeric data
-scaler = StandardScaler()
-scaled_data = scaler.fit_transform(df_numeric)
+    # Compile the feature schema: every question mapped to its fixed vector slot
+    FeatureSchema.compile(features, QUESTIONNAIRE).save(os.path.join(out_dir, SCHEMA_FILE))
 
-# Determine the optimal number of clusters using the elbow method (optional)
-inertia = []
-K_range = range(2, 11)
-for k in K_range:
-    kmeans_test = KMeans(n_clusters=k, random_state=42)
-    kmeans_test.fit(scaled_data)
-    inertia.append(kmeans_test.inertia_)
 
-# You can plot inertia vs K to find elbow or set fixed
-optimal_k = 5  # Adjust based on elbow plot or domain knowledge
+def train(path=DATASET, out_dir='.', streaming=False, k=None, chunksize=50000, sample_size=10000, workers=None, quiet=False,
+          clean=False, kernel="float32"):
+    """Train scaler + KMeans from `path` and write the artifacts to `out_dir`. Returns the stage timings.
 
-# Fit final KMeans
-kmeans = KMeans(n_clusters=optimal_k, random_state=42)
-kmeans.fit(scaled_data)
+    With `clean`, the export first goes through quality.clean: rejected rows are written to
+    quarantine.csv and the report to quality_report.json, both in `out_dir` (so a bundle
+    publishes them), and training reads the clean copy.
+    """
+    timer = StageTimer()
+    os.makedirs(out_dir, exist_ok=True)
+    cleaned = os.path.join(out_dir, CLEANED_FILE) if clean else None
+    try:
+        if clean:
+            with timer("clean"):
+                report = clean_export(path, cleaned, os.path.join(out_dir, QUARANTINE_FILE),
+                                      os.path.join(out_dir, REPORT_FILE), chunksize=chunksize)
+            path = cleaned
+        if streaming:
+            k = k or "auto"
+            result = train_streaming(path, k, timer, sample_size, workers, chunksize, out_dir=out_dir)
+        else:
+            k = k or DEFAULT_K
+            result = train_in_memory(path, k, timer, sample_size, workers)
+    finally:
+        if cleaned and os.path.exists(cleaned):
+            os.remove(cleaned)  # Also when the quality check rejects the export
+    df, features, scaler, kmeans, sweep = result
+    with timer("save"):
+        save_artifacts(df, features, scaler, kmeans, out_dir, kernel)
+    if not quiet:
+        if clean:
+            print(f"Data quality: {report['clean']} of {report['rows']} rows clean, {report['quarantined']} quarantined "
+                  f"({', '.join(f'{r} {n}' for r, n in sorted(report['reasons'].items())) or 'no problems'})")
+        for r in sweep:
+            print(f"k={r['k']:<3} inertia={r['inertia']:.1f}  silhouette={r['silhouette']:.4f}")
+        print(f"Using k={kmeans.n_clusters}")
+        timer.report()
+    return timer.stages
 
-# Assign clusters back to original dataframe
-df['Cluster'] = kmeans.labels_
 
-# Save clustered data
-df.to_csv('clustered_friends.csv', index=False)
+def _parse_k(value):
+    return value if value == "auto" else int(value)
 
-# Save model and scaler for later use
-joblib.dump(kmeans, 'kmeans_model.joblib')
-joblib.dump(scaler, 'scaler.joblib')
 
-# Save the list of features expected by the UI (cleaned column names)
-expected_features = [col.strip().lower() for col in numeric_cols]
-with open('expected_features.json', 'w') as f:
-    json.dump(expected_features, f)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the friendship clustering model.")
+    parser.add_argument("--data", default=DATASET, help="CSV export to train from")
+    parser.add_argument("--out-dir", default=None, help="Write the artifacts into this directory instead of publishing a bundle")
+    parser.add_argument("--models-dir", default=MODELS_DIR, help="Where bundles are published (CURRENT names the served one)")
+    parser.add_argument("--streaming", action="store_true", help="Read the CSV in chunks and fit MiniBatchKMeans")
+    parser.add_argument("--k", type=_parse_k, default=None, help=f"Number of clusters or 'auto' (default: {DEFAULT_K}, 'auto' when streaming)")
+    parser.add_argument("--chunksize", type=int, default=50000, help="Rows per chunk in streaming mode")
+    parser.add_argument("--sample-size", type=int, default=10000, help="Rows used for initialisation and silhouette")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for the k-sweep")
+    parser.add_argument("--no-clean", action="store_true", help="Train on the export as is, without the data-quality stage")
+    parser.add_argument("--kernel", choices=KERNEL_DTYPES, default="float32", help="Storage of the exported assignment kernel")
+    args = parser.parse_args()
 
-print("Model training and data clustering completed successfully!")
\ No newline at end of file
+    options = dict(streaming=args.streaming, k=args.k, chunksize=args.chunksize, sample_size=args.sample_size,
+                   workers=args.workers, clean=not args.no_clean, kernel=args.kernel)
+    try:
+        if args.out_dir:
+            train(args.data, args.out_dir, **options)
+        else:
+            with staged(args.models_dir) as stage:
+                try:
+                    train(args.data, stage, **options)
+                except QualityError as exc:
+                    for name in (QUARANTINE_FILE, REPORT_FILE):  # The failed stage is removed, keep what explains it
+                        shutil.move(os.path.join(stage, name), name)
+                    raise QualityError(str(exc).replace(os.path.join(stage, QUARANTINE_FILE), QUARANTINE_FILE)) from exc
+                version = publish(stage, args.models_dir, dataset=args.data)
+            print(f"Published model bundle {version}")
+    except QualityError as exc:
+        raise SystemExit(f"Data quality check failed: {exc}")
+    print("Model training and data clustering completed successfully!")
@@ -0,0 +1,277 @@
+# incremental.py
+# Add new respondents without retraining from scratch.
+#
+# New rows are appended to the training CSV, assigned with the existing KMeans
+# centroids and appended to clustered_friends.csv. The scaler statistics and the
+# centroids are then updated online (running means), so nothing is refit.
+# A full refit with friend.py is triggered only when the new rows fit the
+# clusters noticeably worse than the training data did. New rows first go through
+# quality.py against the training export, so malformed answers and rows that are
+# already in the training data are quarantined instead of appended. Only the delta
+# is written: the training CSV, clustered_friends.csv and the member table are
+# appended to and truncated back if any later step (including the publish) fails,
+# rewritten model files are restored, and a refit trains into a scratch directory
+# first, so a failed run can simply be retried. A new bundle hard-links the files of
+# the current one that the update replaces rather than appends to.
+import argparse
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import friend
+from bundle import MODELS_DIR, publish, staged
+from cluster_summary import CHUNK_ROWS, SUMMARY_FILE, write_summary
+from kernel import KERNEL_FILE, export_kernel, kernel_dtype
+from member_table import MISSING, TABLE_DIR, TABLE_FILES, MemberTable, MemberTableWriter, normalize_header
+from model_arrays import MODEL_ARRAYS, save_model_arrays
+from quality import CLEANED_FILE, QualityError, clean as clean_export, extend_known_hashes
+
+DRIFT_THRESHOLD = 0.25  # Refit when new rows are 25% further from their centroid than the training rows
+STATE_FILE = 'cluster_state.json'  # Per-cluster counts and the training baseline
+# Bundle files ingest appends to; a staged bundle copies these and hard-links the rest
+APPENDED_FILES = ('clustered_friends.csv',) + tuple(f"{TABLE_DIR}/{name}" for name in TABLE_FILES)
+# Files an online update rewrites (each is small: models, summary, kernel, state)
+MODEL_FILES = ('scaler.joblib', 'kmeans_model.joblib', MODEL_ARRAYS, SUMMARY_FILE, KERNEL_FILE, STATE_FILE)
+
+
+def _dump_atomic(obj, path):
+    tmp = path + '.tmp'
+    joblib.dump(obj, tmp)
+    os.replace(tmp, path)
+
+
+class Rollback:
+    """Undo log of an in-place update: appended files are truncated back, rewritten files restored."""
+
+    def __init__(self):
+        self.sizes = {}  # Path -> size before the first append (None: did not exist)
+        self.contents = {}  # Path -> bytes before the first rewrite (None: did not exist)
+
+    def appending(self, path):
+        if path not in self.sizes:
+            self.sizes[path] = os.path.getsize(path) if os.path.exists(path) else None
+
+    def rewriting(self, path):
+        """Keep a copy of `path` before it is replaced; only for model-sized files."""
+        if path not in self.contents:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self.contents[path] = f.read()
+            else:
+                self.contents[path] = None
+
+    def undo(self):
+        for path, size in self.sizes.items():
+            if size is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            elif os.path.exists(path):
+                os.truncate(path, size)
+        for path, data in self.contents.items():
+            if not os.path.isdir(os.path.dirname(path) or '.'):
+                continue  # e.g. a staging directory that was already discarded
+            if data is None:
+                if os.path.exists(path):
+                    os.remove(path)
+            else:
+                tmp = path + '.undo'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, path)
+
+
+@contextmanager
+def rollback_on_error():
+    """A Rollback that is undone if the block raises."""
+    rollback = Rollback()
+    try:
+        yield rollback
+    except BaseException:
+        rollback.undo()
+        raise
+
+
+def _install(src_dir, out_dir):
+    """Move every file and directory of `src_dir` over its namesake in `out_dir`."""
+    for name in os.listdir(src_dir):
+        src, dst = os.path.join(src_dir, name), os.path.join(out_dir, name)
+        if os.path.isdir(src):
+            old = f"{dst}.{uuid.uuid4().hex[:8]}.old"
+            if os.path.exists(dst):
+                os.replace(dst, old)
+            os.replace(src, dst)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(src, dst)
+
+
+def _members(out_dir):
+    table = os.path.join(out_dir, TABLE_DIR)
+    if os.path.exists(os.path.join(table, 'meta.json')):
+        return MemberTable.open(table)
+    return MemberTable.from_frame(pd.read_csv(os.path.join(out_dir, 'clustered_friends.csv')))
+
+
+def load_state(kmeans, scaler, out_dir='.'):
+    """Cluster sizes and the mean squared distance to the centroid over all training rows."""
+    path = os.path.join(out_dir, STATE_FILE)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    # From the member table: kmeans.labels_ / inertia_ cover only the last mini-batch of a --streaming model
+    members = _members(out_dir)
+    cols = [members.columns.index(normalize_header(f)) for f in scaler.feature_names_in_]
+    total = 0.0
+    for start in range(0, len(members), CHUNK_ROWS):
+        values = np.asarray(members.features[start:start + CHUNK_ROWS, cols], dtype=np.float64)
+        values[values == MISSING] = np.nan
+        scaled = (np.where(np.isnan(values), scaler.mean_, values) - scaler.mean_) / scaler.scale_
+        labels = np.asarray(members.clusters[start:start + CHUNK_ROWS], dtype=np.intp)
+        total += float(((scaled - kmeans.cluster_centers_[labels]) ** 2).sum())
+    counts = np.bincount(members.clusters, minlength=kmeans.n_clusters)
+    return {"counts": counts.tolist(), "baseline_msd": total / max(len(members), 1)}
+
+
+def update_scaler(scaler, kmeans, values):
+    """Fold the new rows into the scaler and re-express the centroids in the new scaled space."""
+    raw_centers = kmeans.cluster_centers_ * scaler.scale_ + scaler.mean_
+    scaler.partial_fit(values)  # NaN values are ignored by the running statistics
+    kmeans.cluster_centers_ = (raw_centers - scaler.mean_) / scaler.scale_
+
+
+def update_centroids(kmeans, counts, scaled, labels):
+    """Exact running mean of every centroid over old and new members."""
+    counts = np.asarray(counts, dtype=np.int64)
+    new_counts = np.bincount(labels, minlength=kmeans.n_clusters)
+    sums = np.zeros_like(kmeans.cluster_centers_)
+    np.add.at(sums, labels, scaled)
+    total = counts + new_counts
+    grown = total > 0
+    centers = kmeans.cluster_centers_.copy()
+    centers[grown] = (counts[grown, None] * centers[grown] + sums[grown]) / total[grown, None]
+    kmeans.cluster_centers_ = centers
+    return total
+
+
+def ingest(new_path, dataset=friend.DATASET, out_dir='.', drift_threshold=DRIFT_THRESHOLD, refit=True, clean=True,
+           rollback=None):
+    """Append, assign and fold in the respondents of `new_path`. Returns a summary dict.
+
+    `dataset` and the files of `out_dir` are changed through `rollback` (by default a fresh
+    one, undone if ingest fails; the CLI passes one that also covers the publish).
+    """
+    if rollback is None:
+        with rollback_on_error() as rollback:
+            return ingest(new_path, dataset, out_dir, drift_threshold, refit, clean, rollback)
+
+    kmeans = joblib.load(os.path.join(out_dir, 'kmeans_model.joblib'))
+    scaler = joblib.load(os.path.join(out_dir, 'scaler.joblib'))
+    state = load_state(kmeans, scaler, out_dir)
+    features = list(scaler.feature_names_in_)
+
+    if clean:
+        cleaned = os.path.join(out_dir, CLEANED_FILE)
+        clean_export(new_path, cleaned, reference=dataset, known=[dataset])
+        new = pd.read_csv(cleaned)
+        os.remove(cleaned)
+    else:
+        new = pd.read_csv(new_path)
+    if not len(new):
+        return {"rows": 0, "mean_sq_distance": 0.0, "baseline": state["baseline_msd"], "drift": 0.0, "refit": False}
+    header = list(pd.read_csv(dataset, nrows=0).columns)
+    new = new.reindex(columns=header)  # Same column order as the training export
+    values = new[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+    # Assign with the current model before anything moves
+    scaled = friend.impute_and_scale(new, features, scaler.mean_, scaler.scale_)
+    labels = kmeans.predict(scaled)
+    msd = float(((scaled - kmeans.cluster_centers_[labels]) ** 2).sum(axis=1).mean()) if len(new) else 0.0
+    drift = msd / state["baseline_msd"] - 1 if state["baseline_msd"] else 0.0
+    summary = {"rows": len(new), "mean_sq_distance": msd, "baseline": state["baseline_msd"], "drift": drift, "refit": False}
+
+    # Write only the delta
+    rollback.appending(dataset)
+    before = os.stat(dataset)
+    new.to_csv(dataset, mode='a', header=False, index=False)
+    if clean:
+        # Dedup hashes of the grown export for the next ingest; a rollback's truncation invalidates them again
+        extend_known_hashes(dataset, before, header)
+    if drift > drift_threshold and refit:
+        scratch = os.path.join(out_dir, f".refit-{uuid.uuid4().hex[:12]}")
+        os.makedirs(scratch)
+        try:
+            friend.train(dataset, scratch)
+            rollback.rewriting(os.path.join(out_dir, STATE_FILE))
+            _install(scratch, out_dir)  # Last step: the old artifacts are not restored after this
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        if os.path.exists(os.path.join(out_dir, STATE_FILE)):
+            os.remove(os.path.join(out_dir, STATE_FILE))  # Rebuilt from the refit model on the next ingest
+        summary["refit"] = True
+        return summary
+
+    clustered = new.copy()
+    clustered['Cluster'] = labels
+    rollback.appending(os.path.join(out_dir, 'clustered_friends.csv'))
+    clustered.to_csv(os.path.join(out_dir, 'clustered_friends.csv'), mode='a', header=False, index=False)
+    table_dir = os.path.join(out_dir, TABLE_DIR)
+    if os.path.exists(table_dir):
+        for name in TABLE_FILES:
+            rollback.appending(os.path.join(table_dir, name))
+        rollback.rewriting(os.path.join(table_dir, 'meta.json'))
+        table = MemberTableWriter(table_dir, append=True)
+        table.write(new, labels)
+        table.close()
+
+    update_scaler(scaler, kmeans, values)
+    scaled = friend.impute_and_scale(new, features, scaler.mean_, scaler.scale_)
+    state["counts"] = update_centroids(kmeans, state["counts"], scaled, labels).tolist()
+    for name in MODEL_FILES:
+        rollback.rewriting(os.path.join(out_dir, name))
+    _dump_atomic(scaler, os.path.join(out_dir, 'scaler.joblib'))
+    _dump_atomic(kmeans, os.path.join(out_dir, 'kmeans_model.joblib'))
+    save_model_arrays(scaler, kmeans, out_dir)
+    write_summary(kmeans, out_dir)
+    export_kernel(scaler, kmeans, out_dir, kernel_dtype(out_dir))
+    tmp = os.path.join(out_dir, STATE_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(out_dir, STATE_FILE))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add new respondents to the clustering model incrementally.")
+    parser.add_argument("new_rows", help="CSV with the new respondents, same columns as the training export")
+    parser.add_argument("--data", default=friend.DATASET, help="Training CSV the rows are appended to")
+    parser.add_argument("--out-dir", default=None, help="Update the artifacts in this directory in place instead of publishing a new bundle")
+    parser.add_argument("--models-dir", default=MODELS_DIR, help="Bundles to update (the current one is copied, updated and published)")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD, help="Relative increase in distance to centroid that triggers a full refit")
+    parser.add_argument("--no-refit", action="store_true", help="Only report drift, never refit")
+    parser.add_argument("--no-clean", action="store_true", help="Append the rows as is, without the data-quality stage")
+    args = parser.parse_args()
+
+    try:
+        with rollback_on_error() as rollback:  # The training CSV keeps the rows only if the publish succeeds
+            if args.out_dir:
+                summary = ingest(args.new_rows, args.data, args.out_dir, args.drift_threshold, refit=not args.no_refit,
+                                 clean=not args.no_clean, rollback=rollback)
+            else:
+                with staged(args.models_dir, from_current=True, copied=APPENDED_FILES) as stage:
+                    summary = ingest(args.new_rows, args.data, stage, args.drift_threshold, refit=not args.no_refit,
+                                     clean=not args.no_clean, rollback=rollback)
+                    summary["bundle"] = publish(stage, args.models_dir, dataset=args.data)
+        if "bundle" in summary:
+            print(f"Published model bundle {summary['bundle']}")
+    except QualityError as exc:
+        raise SystemExit(f"Data quality check failed: {exc}")
+    print(f"Added {summary['rows']} rows, mean squared distance {summary['mean_sq_distance']:.3f} "
+          f"(training {summary['baseline']:.3f}, drift {summary['drift']:+.1%})")
+    if summary["refit"]:
+        print("Drift above threshold: model refit from scratch.")
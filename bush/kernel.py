@@ -0,0 +1,221 @@
+# kernel.py
+# Folded float32 kernel for cluster assignment and compatibility scoring.
+#
+# KMeans.predict(StandardScaler.transform(x)) is argmin_j ||(x - mean) / scale - c_j||^2.
+# Expanding the square and dropping the term that is the same for every cluster folds
+# the scaler into the centroids:
+#
+#   argmin_j  x . w_j + b_j      w_j = -2 c_j / scale      b_j = ||c_j||^2 + 2 c_j . (mean / scale)
+#
+# so assigning a batch is one (n x d) @ (d x k) float32 product on the raw answers, and
+# score_pairs() assigns both sides of every pair with that single product before taking
+# the friend cosine on the scaled rows. friend.py and incremental.py export the folded
+# arrays as kernel.npz (a few KB; int8 with per-feature scales when trained with
+# --kernel int8) and check them against the sklearn objects first: the float32 kernel
+# must assign every check row like KMeans.predict, the int8 one at least 99% of them.
+# NumPy has no int8 matrix product, so int8 only shrinks the file; the weights are
+# widened to float32 once at load time.
+#
+#   python kernel.py verify                  # compare the served kernel with the sklearn models
+import argparse
+import os
+import warnings
+
+import numpy as np
+
+from cluster_summary import centroid_cosine as cosine_table  # Parameters below are named centroid_cosine
+from model_arrays import model_hashes
+from neighbours import normalize_rows
+
+KERNEL_FILE = "kernel.npz"
+DTYPES = ("float32", "int8")
+MIN_AGREEMENT = {"float32": 1.0, "int8": 0.99}  # Share of check rows assigned like KMeans.predict
+CHECK_ROWS = 1000  # Synthetic rows around the centroids when no training rows are given
+FRIEND_WEIGHT = 0.6
+CENTROID_WEIGHT = 0.4
+
+
+def compatibility(friend_sim, centroid_sim):
+    return FRIEND_WEIGHT * friend_sim + CENTROID_WEIGHT * centroid_sim
+
+
+def fold(mean, scale, centers):
+    """Folded (d x k weights, k biases) in float64; see the header for the algebra."""
+    mean, scale, centers = (np.asarray(a, dtype=np.float64) for a in (mean, scale, centers))
+    weights = -2 * (centers / scale).T
+    bias = (centers ** 2).sum(axis=1) + 2 * (centers / scale) @ mean
+    return weights, bias
+
+
+def quantize(weights):
+    """Symmetric int8 weights with one float32 scale per feature (row); features differ widely in scale."""
+    scales = np.abs(weights).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    return np.round(weights / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+class AssignmentKernel:
+    def __init__(self, mean, scale, weights, bias, centroid_cosine, feature_names, dtype="float32"):
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float32)  # Imputation value of missing answers
+        self.inv_scale = (1 / self.scale).astype(np.float32)
+        self.shift = (-np.asarray(mean, dtype=np.float64) / self.scale).astype(np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)  # d x k
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.centroid_cosine = np.asarray(centroid_cosine, dtype=np.float32)  # k x k
+        self.feature_names = [str(f) for f in feature_names]
+        self.dtype = dtype
+        self.n_clusters = len(self.bias)
+
+    @classmethod
+    def from_models(cls, scaler, kmeans, dtype="float32", centroid_cosine=None):
+        """Fold a fitted scaler and KMeans (sklearn or model_arrays) into a kernel."""
+        weights, bias = fold(scaler.mean_, scaler.scale_, kmeans.cluster_centers_)
+        if dtype == "int8":
+            q, scales = quantize(weights)
+            weights = q.astype(np.float32) * scales[:, None]  # What a saved int8 kernel loads as
+        if centroid_cosine is None:
+            centroid_cosine = cosine_table(kmeans.cluster_centers_)
+        return cls(scaler.mean_, scaler.scale_, weights, bias, centroid_cosine, scaler.feature_names_in_, dtype)
+
+    def _raw(self, values):
+        values = np.atleast_2d(np.asarray(values, dtype=np.float32))
+        return np.where(np.isnan(values), self.mean, values)
+
+    def scores(self, values):
+        """n x k folded distances (squared distance up to a per-row constant)."""
+        return self._raw(values) @ self.weights + self.bias
+
+    def assign(self, values):
+        """Cluster of every row of raw answers (NaN = unanswered), like KMeans.predict(scaler.transform(...))."""
+        return np.argmin(self.scores(values), axis=1)
+
+    def transform(self, values):
+        return self._raw(values) * self.inv_scale + self.shift
+
+    def score_pairs(self, a_values, b_values):
+        """(a clusters, b clusters, compatibility) of the pairs a[i], b[i], with one matrix product for both sides."""
+        n = len(a_values)
+        raw = self._raw(np.concatenate([np.atleast_2d(a_values), np.atleast_2d(b_values)]))
+        labels = np.argmin(raw @ self.weights + self.bias, axis=1)
+        scaled = raw * self.inv_scale + self.shift
+        norms = np.linalg.norm(scaled, axis=1)
+        norms[norms == 0] = 1.0  # All-zero rows have cosine 0 with everything
+        friend_sim = (scaled[:n] * scaled[n:]).sum(axis=1) / (norms[:n] * norms[n:])
+        centroid_sim = self.centroid_cosine[labels[:n], labels[n:]]
+        return labels[:n], labels[n:], compatibility(friend_sim, centroid_sim)
+
+    def save(self, path, hashes):
+        """Write the kernel, with the sha256 of the joblib files it was folded from."""
+        arrays = {"mean": self.mean, "scale": self.scale, "bias": self.bias,
+                  "centroid_cosine": self.centroid_cosine, "feature_names": np.asarray(self.feature_names, dtype=str),
+                  "dtype": np.asarray(self.dtype),
+                  "scaler_sha256": np.asarray(hashes["scaler"]), "kmeans_sha256": np.asarray(hashes["kmeans"])}
+        if self.dtype == "int8":
+            arrays["weights"], arrays["weight_scales"] = quantize(self.weights)
+        else:
+            arrays["weights"] = self.weights
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, hashes=None):
+        """Kernel from `path`, or None if `hashes` are given and it was folded from other joblib files."""
+        with np.load(path, allow_pickle=False) as data:
+            if hashes is not None and (str(data["scaler_sha256"]) != hashes["scaler"] or str(data["kmeans_sha256"]) != hashes["kmeans"]):
+                return None
+            dtype = str(data["dtype"])
+            weights = data["weights"].astype(np.float32)
+            if dtype == "int8":
+                weights = weights * data["weight_scales"][:, None]
+            return cls(data["mean"], data["scale"], weights, data["bias"], data["centroid_cosine"],
+                       data["feature_names"].tolist(), dtype)
+
+    @classmethod
+    def load_or_fold(cls, path, hashes, scaler, kmeans, centroid_cosine=None):
+        """The exported kernel when it matches the models, else one folded from them at load time."""
+        kernel = cls.load(path, hashes) if os.path.exists(path) else None
+        return kernel if kernel is not None else cls.from_models(scaler, kmeans, centroid_cosine=centroid_cosine)
+
+
+def check_rows(scaler, kmeans, n=CHECK_ROWS, seed=42):
+    """Raw rows scattered around the centroids, for checking a kernel when no training rows are at hand."""
+    rng = np.random.default_rng(seed)
+    scale = np.asarray(scaler.scale_, dtype=np.float64)
+    centers = np.asarray(kmeans.cluster_centers_, dtype=np.float64) * scale + scaler.mean_
+    return centers[rng.integers(0, len(centers), n)] + rng.normal(size=(n, len(scale))) * scale
+
+
+def verify(kernel, scaler, kmeans, values):
+    """Compare the kernel with scaler.transform / kmeans.predict and a float64 cosine on raw rows."""
+    values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.isnan(values), scaler.mean_, values)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # sklearn objects fitted on a DataFrame, checked on an array
+        scaled = scaler.transform(values)
+        expected = np.asarray(kmeans.predict(scaled))
+    labels = kernel.assign(values)
+    half = len(values) // 2
+    _, _, pair_scores = kernel.score_pairs(values[:half], values[half:2 * half])
+    unit = normalize_rows(scaled)
+    cosine = (unit[:half] * unit[half:2 * half]).sum(axis=1)
+    reference = compatibility(cosine, cosine_table(kmeans.cluster_centers_)[expected[:half], expected[half:2 * half]])
+    return {
+        "rows": len(values),
+        "dtype": kernel.dtype,
+        "label_agreement": float((labels == expected).mean()) if len(values) else 1.0,
+        "max_scaled_error": float(np.abs(kernel.transform(values) - scaled).max()) if len(values) else 0.0,
+        "max_pair_score_error": float(np.abs(pair_scores - reference).max()) if half else 0.0,
+    }
+
+
+def export_kernel(scaler, kmeans, out_dir='.', dtype="float32", values=None):
+    """Fold the models written to `out_dir` into kernel.npz after checking it against them; returns the check."""
+    if dtype not in DTYPES:
+        raise ValueError(f"unknown kernel dtype {dtype!r}")
+    kernel = AssignmentKernel.from_models(scaler, kmeans, dtype)
+    report = verify(kernel, scaler, kmeans, check_rows(scaler, kmeans) if values is None else values)
+    if report["label_agreement"] < MIN_AGREEMENT[dtype]:
+        raise ValueError(f"{dtype} kernel assigns only {report['label_agreement']:.2%} of the check rows like KMeans")
+    kernel.save(os.path.join(out_dir, KERNEL_FILE), model_hashes(out_dir))
+    return report
+
+
+def kernel_dtype(out_dir='.'):
+    """dtype of the kernel already in `out_dir` (float32 if there is none)."""
+    path = os.path.join(out_dir, KERNEL_FILE)
+    if not os.path.exists(path):
+        return "float32"
+    with np.load(path, allow_pickle=False) as data:
+        return str(data["dtype"])
+
+
+if __name__ == "__main__":
+    import joblib
+    import pandas as pd
+
+    from artifacts import load_from
+    from bundle import MODELS_DIR, current_dir
+
+    parser = argparse.ArgumentParser(description="Check the served assignment kernel against the sklearn models.")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("--dir", default=None, help="Bundle or artifact directory (default: the current bundle)")
+    parser.add_argument("--data", default=None, help="CSV of raw rows to check on (default: the member table)")
+    args = parser.parse_args()
+
+    base_dir = args.dir or current_dir(MODELS_DIR) or "."
+    artifacts = load_from(base_dir)
+    scaler = joblib.load(os.path.join(base_dir, "scaler.joblib"))
+    kmeans = joblib.load(os.path.join(base_dir, "kmeans_model.joblib"))
+    features = list(scaler.feature_names_in_)
+    if args.data:
+        values = pd.read_csv(args.data)[features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    else:
+        values = artifacts.members.feature_values(features)
+    source = "kernel.npz" if os.path.exists(os.path.join(base_dir, KERNEL_FILE)) else "folded at load time"
+    report = verify(artifacts.kernel, scaler, kmeans, values)
+    print(f"{base_dir} ({source}, {report['dtype']}): {report['rows']} rows, "
+          f"label agreement {report['label_agreement']:.2%}, max scaled error {report['max_scaled_error']:.2e}, "
+          f"max pair score error {report['max_pair_score_error']:.2e}")
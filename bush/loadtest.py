@@ -0,0 +1,93 @@
+# loadtest.py
+# Local load test for service.py: keep-alive clients hammer one endpoint and the
+# script reports throughput and latency percentiles.
+#
+#   python service.py &
+#   python loadtest.py --endpoint /compatibility --clients 32 --seconds 10
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+import friend
+
+
+def sample_rows(n, seed=42):
+    """Answer rows drawn from the training export, in training feature order."""
+    import pandas as pd
+
+    df = pd.read_csv(friend.DATASET)
+    values = df[friend.numeric_columns(df)].fillna(0).to_numpy().tolist()
+    rng = np.random.default_rng(seed)
+    return [values[i] for i in rng.integers(0, len(values), n)]
+
+
+def payload(endpoint, rows, batch):
+    pick = rows[:batch]
+    if endpoint == "/compatibility":
+        return {"a": pick, "b": rows[batch:2 * batch]}
+    if endpoint == "/suggestions":
+        return {"answers": pick, "k": 5}
+    return {"answers": pick}
+
+
+async def client(host, port, endpoint, bodies, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = 0
+    while time.perf_counter() < deadline:
+        body = bodies[i % len(bodies)]
+        i += 1
+        start = time.perf_counter()
+        writer.write(f"POST {endpoint} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        status = await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+        if b" 200 " not in status:
+            errors.append(status)
+    writer.close()
+
+
+async def run(host, port, endpoint, clients, seconds, batch):
+    rows = sample_rows(1000)
+    bodies = [json.dumps(payload(endpoint, rows[i:] + rows[:i], batch)).encode() for i in range(0, 1000, 50)]
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, endpoint, bodies, deadline, latencies, errors) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        "endpoint": endpoint,
+        "clients": clients,
+        "rows_per_request": batch,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else None,
+        "p99_ms": float(np.percentile(ms, 99)) if len(ms) else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the scoring service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--endpoint", default="/compatibility", choices=["/assign", "/compatibility", "/suggestions"])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=1, help="Rows per request")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.host, args.port, args.endpoint, args.clients, args.seconds, args.batch))
+    print(json.dumps(result, indent=2))
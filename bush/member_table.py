@@ -0,0 +1,186 @@
+# member_table.py
+# Typed, memory-mapped columnar copy of clustered_friends.csv.
+#
+# friend.py writes it next to the CSV so the app never parses text at start-up:
+#
+#   member_table/
+#     meta.json     row count, normalized feature column names, gender categories
+#     features.i8   rows x features int8 answers (-1 = missing)
+#     cluster.u8    uint8 cluster of every row
+#     gender.u8     uint8 code into meta["genders"] (255 = missing)
+#     names.bin     UTF-8 names back to back
+#     names.off     int64 offsets into names.bin (rows + 1)
+#
+# Headers are normalized once at write time ('  Openness To Experience' becomes
+# 'Openness To Experience'). Columns are opened with np.memmap, so loading is
+# zero-copy and pages are shared between worker processes. meta.json is written
+# last, so readers never see rows that are still being appended.
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+TABLE_DIR = 'member_table'
+NAME_COLUMN = 'Full Name'
+GENDER_COLUMN = 'Gender'
+MISSING = -1
+TABLE_FILES = ('features.i8', 'cluster.u8', 'gender.u8', 'names.bin', 'names.off')  # Appended to; meta.json is replaced
+NO_GENDER = 255
+
+
+def normalize_header(name):
+    """Strip and collapse the whitespace of a CSV header."""
+    return " ".join(str(name).split())
+
+
+class MemberTable:
+    def __init__(self, features, clusters, gender_codes, genders, names_blob, name_offsets, columns):
+        self.features = features  # int8, rows x len(columns)
+        self.clusters = clusters  # uint8
+        self.gender_codes = gender_codes  # uint8
+        self.genders = list(genders)
+        self.names_blob = names_blob  # uint8 UTF-8 bytes
+        self.name_offsets = name_offsets  # int64, rows + 1
+        self.columns = list(columns)
+
+    def __len__(self):
+        return len(self.clusters)
+
+    @classmethod
+    def open(cls, path=TABLE_DIR):
+        """Memory-map a table written by MemberTableWriter."""
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        rows, cols = meta["rows"], len(meta["columns"])
+
+        def column(name, dtype, shape):
+            if not np.prod(shape):
+                return np.zeros(shape, dtype=dtype)
+            return np.memmap(os.path.join(path, name), dtype=dtype, mode='r', shape=shape)
+
+        offsets = column('names.off', np.int64, (rows + 1,))
+        return cls(
+            features=column('features.i8', np.int8, (rows, cols)),
+            clusters=column('cluster.u8', np.uint8, (rows,)),
+            gender_codes=column('gender.u8', np.uint8, (rows,)),
+            genders=meta["genders"],
+            names_blob=column('names.bin', np.uint8, (int(offsets[-1]) if rows else 0,)),
+            name_offsets=offsets,
+            columns=meta["columns"],
+        )
+
+    @classmethod
+    def from_frame(cls, df, columns=None):
+        """In-memory table from a clustered DataFrame (used when no table was written)."""
+        encoded = _encode(df, columns, genders=[])
+        return cls(
+            features=encoded["features"], clusters=encoded["clusters"], gender_codes=encoded["gender_codes"],
+            genders=encoded["genders"], names_blob=np.frombuffer(encoded["names_blob"], dtype=np.uint8),
+            name_offsets=np.concatenate([[0], np.cumsum(encoded["name_lengths"])]).astype(np.int64),
+            columns=encoded["columns"],
+        )
+
+    def name(self, row):
+        return bytes(self.names_blob[self.name_offsets[row]:self.name_offsets[row + 1]]).decode('utf-8')
+
+    def names(self):
+        blob = bytes(self.names_blob)
+        return [blob[a:b].decode('utf-8') for a, b in zip(self.name_offsets[:-1], self.name_offsets[1:])]
+
+    def gender(self, row):
+        code = self.gender_codes[row]
+        return self.genders[code] if code != NO_GENDER else ""
+
+    def gender_labels(self):
+        labels = np.array(self.genders + [""], dtype=object)
+        codes = np.where(self.gender_codes == NO_GENDER, len(self.genders), self.gender_codes)
+        return labels[codes]
+
+    def feature_values(self, columns=None, start=0, stop=None):
+        """Float matrix of the given (normalized) columns of rows start:stop, NaN where the answer is missing."""
+        cols = [self.columns.index(normalize_header(c)) for c in columns] if columns is not None else slice(None)
+        values = np.asarray(self.features[start:stop, cols], dtype=np.float64)
+        values[values == MISSING] = np.nan
+        return values
+
+
+def _encode(chunk, columns, genders):
+    import pandas as pd  # Writers and the CSV fallback only; reading the table needs just NumPy
+
+    chunk = chunk.rename(columns=normalize_header)
+    if columns is None:
+        columns = [c for c in chunk.select_dtypes(include=[np.number]).columns if c != 'Cluster']
+    values = chunk[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    features = np.where(np.isnan(values), MISSING, np.clip(np.round(values), 0, 127)).astype(np.int8)
+
+    gender_values = chunk[GENDER_COLUMN].astype("string").str.strip() if GENDER_COLUMN in chunk else pd.Series([pd.NA] * len(chunk))
+    genders.extend(g for g in gender_values.dropna().unique() if g not in genders)
+    codes = pd.Categorical(gender_values, categories=genders).codes
+    gender_codes = np.where(codes < 0, NO_GENDER, codes).astype(np.uint8)
+
+    names = chunk[NAME_COLUMN].astype("string").str.strip().fillna("") if NAME_COLUMN in chunk else pd.Series([""] * len(chunk))
+    encoded_names = [n.encode('utf-8') for n in names]
+    return {
+        "columns": list(columns),
+        "features": features,
+        "clusters": chunk['Cluster'].to_numpy(dtype=np.uint8),
+        "gender_codes": gender_codes,
+        "genders": genders,
+        "names_blob": b"".join(encoded_names),
+        "name_lengths": np.array([len(n) for n in encoded_names], dtype=np.int64),
+    }
+
+
+class MemberTableWriter:
+    """Writes (or appends to) a member table chunk by chunk."""
+
+    def __init__(self, path=TABLE_DIR, columns=None, append=False):
+        self.path = path
+        self.append = append and os.path.exists(os.path.join(path, 'meta.json'))
+        self.target = path if self.append else path + '.tmp'
+        if self.append:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            self.columns = meta["columns"]
+            self.genders = meta["genders"]
+            self.rows = meta["rows"]
+            self.name_end = int(np.fromfile(os.path.join(path, 'names.off'), dtype=np.int64)[-1])
+        else:
+            shutil.rmtree(self.target, ignore_errors=True)
+            os.makedirs(self.target)
+            self.columns = [normalize_header(c) for c in columns] if columns is not None else None
+            self.genders = []
+            self.rows = 0
+            self.name_end = 0
+            np.array([0], dtype=np.int64).tofile(os.path.join(self.target, 'names.off'))
+
+    def write(self, chunk, clusters):
+        """Append rows of a raw (un-normalized) frame with their cluster labels."""
+        chunk = chunk.assign(Cluster=np.asarray(clusters))
+        encoded = _encode(chunk, self.columns, self.genders)
+        self.columns = encoded["columns"]
+        offsets = self.name_end + np.cumsum(encoded["name_lengths"])
+        for name, data in (('features.i8', encoded["features"]), ('cluster.u8', encoded["clusters"]),
+                           ('gender.u8', encoded["gender_codes"]), ('names.off', offsets)):
+            with open(os.path.join(self.target, name), 'ab') as f:
+                f.write(np.ascontiguousarray(data).tobytes())
+        with open(os.path.join(self.target, 'names.bin'), 'ab') as f:
+            f.write(encoded["names_blob"])
+        self.rows += len(chunk)
+        self.name_end = int(offsets[-1]) if len(offsets) else self.name_end
+
+    def close(self):
+        meta = {"rows": self.rows, "columns": self.columns, "genders": self.genders, "written_at": time.time()}
+        tmp = os.path.join(self.target, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.target, 'meta.json'))  # Publishes the new rows
+        if not self.append:
+            old = self.path + '.old'
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.exists(self.path):
+                os.replace(self.path, old)
+            os.replace(self.target, self.path)
+            shutil.rmtree(old, ignore_errors=True)
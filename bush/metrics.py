@@ -0,0 +1,164 @@
+# metrics.py
+# Opt-in latency instrumentation for the Streamlit pages and the scoring service.
+#
+# Everything is off unless MATCHMINDS_METRICS is set, and a disabled stage() costs one
+# attribute lookup. When enabled:
+#
+#   MATCHMINDS_METRICS=1                 collect per-stage counters and latency histograms
+#   MATCHMINDS_METRICS_LOG=1             also log one JSON line per stage (logger "matchminds.metrics")
+#   MATCHMINDS_METRICS_PORT=9108         serve them in Prometheus text format on http://:9108/metrics
+#   MATCHMINDS_PROFILE=profiles/         write a cProfile capture of every rerun into that directory
+#                                        (a pyinstrument HTML report instead if MATCHMINDS_PROFILER=pyinstrument)
+#
+# The scoring service also exposes the same data on GET /metrics. Modules with state worth
+# watching (the artifact registry) add gauges with register_gauges(); those are rendered
+# whether or not MATCHMINDS_METRICS is set, since reading them costs nothing until scraped.
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+ENABLED = bool(os.environ.get("MATCHMINDS_METRICS"))
+LOG = bool(os.environ.get("MATCHMINDS_METRICS_LOG"))
+PORT = int(os.environ.get("MATCHMINDS_METRICS_PORT", 0) or 0)
+PROFILE_DIR = os.environ.get("MATCHMINDS_PROFILE")
+PROFILER = os.environ.get("MATCHMINDS_PROFILER", "cprofile")
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # Seconds
+
+logger = logging.getLogger("matchminds.metrics")
+_lock = threading.Lock()
+_histograms = {}  # stage -> [bucket counts..., +Inf count, sum]
+_gauge_sources = []  # Callables returning {name: (help, [(labels, value), ...])}
+_server_started = False
+
+
+def observe(name, seconds):
+    """Record one duration of `name`."""
+    if not ENABLED:
+        return
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[len(BUCKETS)] += 1
+        h[-1] += seconds
+    if LOG:
+        logger.info(json.dumps({"stage": name, "ms": round(seconds * 1000, 3)}))
+
+
+@contextlib.contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def stage(name):
+    """Context manager timing one stage; a no-op unless metrics are enabled."""
+    return _timed(name) if ENABLED else contextlib.nullcontext()
+
+
+def snapshot():
+    """{stage: {"count", "sum_seconds"}} of everything recorded so far."""
+    with _lock:
+        return {name: {"count": h[len(BUCKETS)], "sum_seconds": h[-1]} for name, h in _histograms.items()}
+
+
+def register_gauges(source):
+    """Render the gauges `source()` returns, {name: (help, [(labels dict, value), ...])}, on every scrape."""
+    with _lock:
+        if source not in _gauge_sources:
+            _gauge_sources.append(source)
+
+
+def _gauge_lines():
+    lines = []
+    for source in list(_gauge_sources):
+        for name, (text, samples) in source().items():
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} gauge"]
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return lines
+
+
+def render_prometheus():
+    """All histograms, and the registered gauges, in the Prometheus text exposition format."""
+    lines = ["# HELP matchminds_stage_seconds Latency of instrumented stages.",
+             "# TYPE matchminds_stage_seconds histogram"]
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            for bound, count in zip(BUCKETS, h):
+                lines.append(f'matchminds_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'matchminds_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {h[len(BUCKETS)]}')
+            lines.append(f'matchminds_stage_seconds_sum{{stage="{name}"}} {h[-1]}')
+            lines.append(f'matchminds_stage_seconds_count{{stage="{name}"}} {h[len(BUCKETS)]}')
+    return "\n".join(lines + _gauge_lines()) + "\n"
+
+
+def start_server(port=PORT):
+    """Serve /metrics from a daemon thread, once per process."""
+    global _server_started
+    if not (ENABLED and port) or _server_started:
+        return
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render_prometheus().encode()
+            self.send_response(200 if self.path == "/metrics" else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _lock:
+        if _server_started:
+            return
+        server = ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        _server_started = True
+
+
+@contextlib.contextmanager
+def rerun(page):
+    """Time one full Streamlit rerun of `page`, profiling it when MATCHMINDS_PROFILE is set."""
+    start_server()
+    if not PROFILE_DIR:
+        with stage(f"rerun:{page}"):
+            yield
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{page}-{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10**6}")
+    if PROFILER == "pyinstrument":
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            with stage(f"rerun:{page}"):
+                yield
+        finally:
+            profiler.stop()
+            with open(path + ".html", "w") as f:
+                f.write(profiler.output_html())
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            with stage(f"rerun:{page}"):
+                yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path + ".prof")
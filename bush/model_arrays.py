@@ -0,0 +1,73 @@
+# model_arrays.py
+# The fitted scaler and KMeans model as plain NumPy arrays, so serving never imports sklearn.
+#
+# Unpickling scaler.joblib / kmeans_model.joblib imports scikit-learn, which costs well
+# over a second on a cold replica, while the runtime only reads a few attributes of
+# the two models. friend.py and incremental.py export those attributes next to the
+# joblib files as model_arrays.npz, together with the hashes of the joblib files they
+# came from; the artifact registry uses the export only while those hashes still match.
+import hashlib
+import os
+
+import numpy as np
+
+MODEL_ARRAYS = "model_arrays.npz"
+JOBLIB_FILES = {"scaler": "scaler.joblib", "kmeans": "kmeans_model.joblib"}
+
+
+class ScalerArrays:
+    """The fitted StandardScaler attributes used at serving time."""
+
+    def __init__(self, mean, scale, feature_names):
+        self.mean_ = np.asarray(mean, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(self.mean_)
+
+    def transform(self, values):
+        return (np.asarray(values, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class KMeansArrays:
+    """The fitted KMeans attributes used at serving time."""
+
+    def __init__(self, centers):
+        self.cluster_centers_ = np.asarray(centers, dtype=np.float64)
+        self.n_clusters = len(self.cluster_centers_)
+
+    def predict(self, scaled):
+        scaled = np.atleast_2d(np.asarray(scaled, dtype=np.float64))
+        center_sq = (self.cluster_centers_ ** 2).sum(axis=1)
+        return np.argmin(center_sq - 2 * scaled @ self.cluster_centers_.T, axis=1)
+
+
+def model_hashes(out_dir='.'):
+    """sha256 of the two joblib files in `out_dir`, which every export records to detect stale copies."""
+    hashes = {}
+    for name, file in JOBLIB_FILES.items():
+        with open(os.path.join(out_dir, file), "rb") as f:
+            hashes[name] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def save_model_arrays(scaler, kmeans, out_dir='.'):
+    """Export the two models written to `out_dir` as model_arrays.npz (atomically)."""
+    hashes = model_hashes(out_dir)
+    path = os.path.join(out_dir, MODEL_ARRAYS)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f,
+                 mean=scaler.mean_, scale=scaler.scale_,
+                 feature_names=np.asarray(scaler.feature_names_in_, dtype=str),
+                 centers=kmeans.cluster_centers_,
+                 scaler_sha256=np.asarray(hashes["scaler"]), kmeans_sha256=np.asarray(hashes["kmeans"]))
+    os.replace(tmp, path)
+
+
+def load_model_arrays(path, hashes):
+    """(ScalerArrays, KMeansArrays) from `path`, or None if it was exported from other joblib files."""
+    with np.load(path, allow_pickle=False) as data:
+        if str(data["scaler_sha256"]) != hashes["scaler"] or str(data["kmeans_sha256"]) != hashes["kmeans"]:
+            return None
+        return (ScalerArrays(data["mean"], data["scale"], data["feature_names"].tolist()),
+                KMeansArrays(data["centers"]))
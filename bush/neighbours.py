@@ -0,0 +1,158 @@
+# neighbours.py
+# Nearest-neighbour search over members, ranked by cosine similarity of the
+# scaled feature vectors (the same metric test.py uses for friend_sim).
+#
+# The index is an IVF layout seeded from the trained KMeans model: every member
+# sits in the inverted list of its KMeans cluster, and a query probes the
+# `nprobe` lists whose centroids are most similar to it. Probing every list is
+# an exact search. The index is persisted inside the bundle it was built from (so
+# it is pruned with it) and rebuilt when it is missing, stale or unreadable.
+# Run `python neighbours.py` for a recall/latency benchmark.
+import os  # Paths and atomic file replacement
+import time  # Benchmark timings
+import uuid  # Unique temporary file names
+import zipfile  # Corrupt index files
+
+import numpy as np  # NumPy for vector math
+
+from cluster_summary import CHUNK_ROWS  # Member-table rows converted at a time
+
+INDEX_FILE = "member_index.npz"
+
+
+def normalize_rows(x):
+    """Scale every row to unit length so a dot product is the cosine similarity."""
+    x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0  # All-zero rows stay zero (cosine 0 with everything)
+    return x / norms
+
+
+def scale_members(members, scaler, chunk_rows=CHUNK_ROWS):
+    """Scaled float32 feature matrix of every member-table row, missing answers imputed with the training mean."""
+    scaled = np.empty((len(members), len(scaler.feature_names_in_)), dtype=np.float32)
+    for start in range(0, len(members), chunk_rows):  # Float64 only for one chunk at a time
+        values = members.feature_values(scaler.feature_names_in_, start, start + chunk_rows)
+        values = np.where(np.isnan(values), scaler.mean_, values)
+        scaled[start:start + chunk_rows] = (values - scaler.mean_) / scaler.scale_  # Same as scaler.transform
+    return scaled
+
+
+class MemberIndex:
+    def __init__(self, vectors, lists, centroids, version=""):
+        lists = np.asarray(lists, dtype=np.int64)
+        self.version = version
+        self.row_ids = np.argsort(lists, kind="stable")  # Member rows in list order
+        self.positions = np.empty_like(self.row_ids)  # Member row -> position in self.vectors
+        self.positions[self.row_ids] = np.arange(len(self.row_ids))
+        self.vectors = normalize_rows(vectors)[self.row_ids] if len(lists) else np.zeros((0, np.shape(centroids)[1]), np.float32)
+        counts = np.bincount(lists, minlength=len(centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.centroids = normalize_rows(centroids)
+
+    @classmethod
+    def from_artifacts(cls, artifacts, path=None):
+        """Load the persisted index for these artifacts, or build and persist it."""
+        path = path or os.path.join(artifacts.base_dir, INDEX_FILE)
+        try:
+            index = cls.load(path)
+            if index.version == artifacts.version:
+                return index
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass  # Missing or unreadable: rebuilt below
+        vectors = scale_members(artifacts.members, artifacts.scaler)
+        lists = artifacts.members.clusters
+        index = cls(vectors, lists, artifacts.kmeans.cluster_centers_, version=artifacts.version)
+        try:
+            index.save(path)
+        except OSError:
+            pass  # Read-only bundle: serve the index from memory
+        return index
+
+    def save(self, path):
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"  # Unique, so concurrent builders never share a file
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, vectors=self.vectors, row_ids=self.row_ids, offsets=self.offsets,
+                         centroids=self.centroids, version=np.array(self.version))
+            os.replace(tmp, path)  # Readers never see a half-written index
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            index = cls.__new__(cls)
+            index.version = str(data["version"])
+            index.vectors = data["vectors"]
+            index.row_ids = data["row_ids"]
+            index.offsets = data["offsets"]
+            index.centroids = data["centroids"]
+        index.positions = np.empty_like(index.row_ids)
+        index.positions[index.row_ids] = np.arange(len(index.row_ids))
+        return index
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def _top_k(self, positions, scores, k):
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            positions, scores = positions[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        return self.row_ids[positions[order]], scores[order]
+
+    def search(self, query, k=5, nprobe=2, exclude=()):
+        """Approximate top-k members by cosine similarity: (member rows, scores)."""
+        q = normalize_rows(query)[0]
+        if nprobe >= self.nlist:
+            return self.exact_search(query, k, exclude)
+        probe = np.argsort(-(self.centroids @ q))[:nprobe]
+        positions = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe])
+        if len(exclude):
+            positions = positions[~np.isin(self.row_ids[positions], exclude)]
+        return self._top_k(positions, self.vectors[positions] @ q, k)
+
+    def exact_search(self, query, k=5, exclude=()):
+        """Exhaustive top-k over every member: (member rows, scores)."""
+        q = normalize_rows(query)[0]
+        positions = np.arange(len(self.row_ids))
+        if len(exclude):
+            positions = positions[~np.isin(self.row_ids, exclude)]
+        return self._top_k(positions, self.vectors[positions] @ q, k)
+
+    def rank(self, query, rows, k=5):
+        """Exact top-k among the given member rows, e.g. the filtered candidates of one cluster."""
+        q = normalize_rows(query)[0]
+        positions = self.positions[np.asarray(rows, dtype=np.int64)]
+        return self._top_k(positions, self.vectors[positions] @ q, k)
+
+
+def recall_benchmark(index, queries, k=5, nprobes=(1, 2, 3)):
+    """Recall@k of the IVF search against exact search, with mean latency per query."""
+    exact = []
+    start = time.perf_counter()
+    for q in queries:
+        exact.append(set(index.exact_search(q, k)[0].tolist()))
+    results = [{"nprobe": "exact", "recall": 1.0, "ms_per_query": (time.perf_counter() - start) * 1000 / len(queries)}]
+    for nprobe in nprobes:
+        hits = 0
+        start = time.perf_counter()
+        for q, truth in zip(queries, exact):
+            hits += len(truth & set(index.search(q, k, nprobe)[0].tolist()))
+        elapsed = time.perf_counter() - start
+        results.append({"nprobe": nprobe, "recall": hits / (len(queries) * k), "ms_per_query": elapsed * 1000 / len(queries)})
+    return results
+
+
+if __name__ == "__main__":
+    from artifacts import load_artifacts
+
+    artifacts = load_artifacts()
+    index = MemberIndex.from_artifacts(artifacts)
+    queries = scale_members(artifacts.members, artifacts.scaler)
+    print(f"{len(index.row_ids)} members, {index.nlist} lists, k=5")
+    for result in recall_benchmark(index, queries):
+        print(f"nprobe={result['nprobe']:>5}  recall@5={result['recall']:.3f}  {result['ms_per_query']:.3f} ms/query")
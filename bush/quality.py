@@ -0,0 +1,355 @@
+# quality.py
+# Streaming validation and cleaning of a questionnaire export, run before training.
+#
+#   python quality.py "dataset of friendship compatibility.csv" cleaned.csv
+#   python quality.py new_rows.csv cleaned.csv --reference "dataset of friendship compatibility.csv" \
+#                     --known "dataset of friendship compatibility.csv"
+#
+# The export is read in chunks, so memory stays constant apart from an 8-byte hash per
+# distinct row, and every row is
+#   - decoded with the detected encoding (UTF-8 with or without BOM, else cp1252, else Latin-1)
+#     by pandas' C parser; a line with more (non-empty) fields than the header is malformed
+#   - mapped onto the reference header by feature_key, so '  Openness To Experience' and
+#     'openness to experience' are the same column
+#   - checked: answers numeric, whole and inside the feature's range, at least one answered
+#   - dropped if it repeats an earlier row or a row of a --known file (same normalized
+#     name and answers; --dedup name keys on the name alone). The row hashes of a known
+#     file are cached next to it (<file>.hashes.npz) and reused while the file is
+#     unchanged; extend_known_hashes() adds rows appended to it without a rescan
+# Clean rows are written in UTF-8 with the reference header. Rejected rows go to the
+# quarantine CSV with their reason, and a JSON report counts both. friend.py and
+# incremental.py run this first, so a bad row becomes a quarantine entry instead of a
+# failed (or silently skewed) training run. The checks run over each chunk's whole answer
+# block with NumPy, and only rejected rows are handled one by one.
+import argparse
+import codecs
+import csv
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from member_table import GENDER_COLUMN, NAME_COLUMN, normalize_header
+from schema import feature_key
+
+QUARANTINE_FILE = 'quarantine.csv'
+REPORT_FILE = 'quality_report.json'
+CLEANED_FILE = '.cleaned.csv'  # Temporary clean copy the training scripts read from
+ENCODINGS = ('utf-8', 'cp1252', 'latin-1')  # Tried in order; Latin-1 decodes any byte
+RANGES = {"age": (10, 100)}  # Inclusive bounds by feature key
+DEFAULT_RANGE = (0, 5)  # Likert answers 1-5 and interest flags 0/1
+TEXT_COLUMNS = {feature_key(NAME_COLUMN), feature_key(GENDER_COLUMN), "cluster"}
+MAX_BAD_FRACTION = 0.05  # clean() fails when a larger share of the rows is quarantined
+CHECKS = ("non_numeric", "not_whole", "out_of_range")
+HASHES_SUFFIX = '.hashes.npz'  # Cached row hashes of a known file
+HASH_VERSION = 1  # Bump when _parse or _row_hashes change what a row hashes to
+
+
+class QualityError(ValueError):
+    pass
+
+
+def detect_encoding(path, candidates=ENCODINGS, block=1 << 20):
+    """First encoding in `candidates` that decodes the whole file, read in blocks."""
+    with open(path, 'rb') as f:
+        bom = f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(block), b""):
+                    decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        return 'utf-8-sig' if encoding == 'utf-8' and bom else encoding
+    raise QualityError(f"{path}: none of {', '.join(candidates)} decodes the file")
+
+
+def read_header(path, encoding=None):
+    if encoding is None:  # Only the header line is decoded, so only it needs to decode
+        with open(path, 'rb') as f:
+            line = f.readline()
+        for encoding in ('utf-8-sig',) + ENCODINGS[1:]:
+            try:
+                line.decode(encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+    with open(path, newline='', encoding=encoding) as f:
+        return next(csv.reader(f), [])
+
+
+def map_header(header, reference):
+    """{input column: reference column} by feature_key, plus the unexpected and the missing columns."""
+    slots = {}
+    for col in reference:
+        slots.setdefault(feature_key(col), col)
+    mapping, unexpected, keys = {}, [], {}
+    for col in header:
+        key = feature_key(col)
+        if key in keys:
+            raise QualityError(f"columns {keys[key]!r} and {col!r} are the same feature")
+        keys[key] = col
+        if key in slots:
+            mapping[col] = slots[key]
+        else:
+            unexpected.append(col)
+    missing = [col for col in reference if col not in mapping.values()]
+    return mapping, unexpected, missing
+
+
+def normalize_name(name):
+    return normalize_header(name).casefold()
+
+
+def feature_range(column):
+    return RANGES.get(feature_key(column), DEFAULT_RANGE)
+
+
+def _read(path, encoding, chunksize, bad_lines):
+    """Chunks of the file as text (NaN when empty); lines with too many fields go to `bad_lines` instead."""
+    header = read_header(path, encoding)
+    # The C parser rejects a line longer than its names, so give it room for as many surplus
+    # fields as the header has and treat any filled one as a malformed line
+    surplus = [f"\0surplus{i}" for i in range(len(header))]
+    chunks = pd.read_csv(path, chunksize=chunksize, encoding=encoding, dtype=object, header=None, skiprows=1,
+                         names=header + surplus)
+    try:
+        for chunk in chunks:
+            long = chunk[surplus].notna().any(axis=1).to_numpy()
+            if long.any():
+                for row in chunk[long].itertuples(index=False):
+                    fields = list(row)
+                    while fields[-1] != fields[-1]:
+                        fields.pop()  # Drop the surplus slots the line did not fill
+                    bad_lines.append(["" if v != v else v for v in fields])
+            yield chunk.loc[~long, header]
+    except pd.errors.ParserError as exc:
+        raise QualityError(f"{path}: more than twice the header's fields on a line ({exc})") from exc
+
+
+def _parse(chunk, mapping, reference, features):
+    """The chunk in reference columns (text columns stripped, NaN when empty), its answers as
+    floats (NaN when unparsable) and a mask of the answers that were given at all."""
+    frame = chunk[list(mapping)].rename(columns=mapping).reindex(columns=reference)
+    for col in mapping.values():
+        if col not in features:
+            frame[col] = frame[col].str.strip().replace("", np.nan)
+    block = frame[features].to_numpy(dtype=object)
+    try:
+        number = block.astype(np.float64)  # One C-level conversion when every answer parses
+    except ValueError:
+        number = np.empty(block.shape)
+        for j in range(block.shape[1]):
+            try:
+                number[:, j] = block[:, j].astype(np.float64)
+            except ValueError:  # Only the columns holding a bad answer take the slow, forgiving path
+                number[:, j] = pd.to_numeric(pd.Series(block[:, j]), errors='coerce').to_numpy(dtype=np.float64)
+    present = ~np.isnan(number)
+    given = block[~present]  # Empty, blank or unparsable; only the last counts as an answer
+    present[~present] = pd.notna(given) & np.array([bool(str(v).strip()) for v in given], dtype=bool)
+    return frame, pd.DataFrame(number, columns=features, index=frame.index), present
+
+
+def _row_hashes(frame, values, dedup, name_column):
+    names = frame[name_column].fillna("").map(normalize_name) if name_column else pd.Series("", index=frame.index)
+    key = values.assign(_name=names) if dedup == "row" else names.to_frame()
+    return pd.util.hash_pandas_object(key, index=False).to_numpy(), names.to_numpy() != ""
+
+
+def _reference_columns(reference):
+    """Feature columns and the name column of a reference header."""
+    features = [col for col in reference if feature_key(col) not in TEXT_COLUMNS]
+    name_column = next((col for col in reference if feature_key(col) == feature_key(NAME_COLUMN)), None)
+    return features, name_column
+
+
+def _hash_rows(chunks, mapping, reference, dedup):
+    features, name_column = _reference_columns(reference)
+    hashes = [np.zeros(0, dtype=np.uint64)]
+    for chunk in chunks:
+        frame, values, _ = _parse(chunk, mapping, reference, features)
+        hashes.append(_row_hashes(frame, values, dedup, name_column)[0])
+    return np.unique(np.concatenate(hashes))
+
+
+def _contains(sorted_hashes, hashes):
+    """Which of `hashes` are in the sorted array `sorted_hashes`."""
+    at = np.minimum(np.searchsorted(sorted_hashes, hashes), max(len(sorted_hashes) - 1, 0))
+    return sorted_hashes[at] == hashes if len(sorted_hashes) else np.zeros(len(hashes), dtype=bool)
+
+
+def _hash_cache(path):
+    return path + HASHES_SUFFIX
+
+
+def _load_hashes(path, reference, dedup, stat):
+    """Cached hashes of `path` if they were computed from the file as `stat` describes it."""
+    try:
+        with np.load(_hash_cache(path), allow_pickle=False) as data:
+            if (int(data["version"]) == HASH_VERSION and str(data["dedup"]) == dedup
+                    and data["reference"].tolist() == list(reference)
+                    and int(data["bytes"]) == stat.st_size and int(data["mtime_ns"]) == stat.st_mtime_ns):
+                return data["hashes"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _save_hashes(path, reference, dedup, hashes):
+    stat = os.stat(path)
+    tmp = f"{_hash_cache(path)}.tmp"
+    with open(tmp, 'wb') as f:
+        np.savez(f, hashes=hashes, version=HASH_VERSION, dedup=np.asarray(dedup), reference=np.asarray(reference, dtype=str),
+                 bytes=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    os.replace(tmp, _hash_cache(path))
+
+
+def known_hashes(path, reference, dedup="row", chunksize=50000):
+    """Sorted row hashes of a known file, from its cache while the file is unchanged."""
+    hashes = _load_hashes(path, reference, dedup, os.stat(path))
+    if hashes is None:
+        encoding = detect_encoding(path)
+        mapping = map_header(read_header(path, encoding), reference)[0]
+        hashes = _hash_rows(_read(path, encoding, chunksize, []), mapping, reference, dedup)
+        _save_hashes(path, reference, dedup, hashes)
+    return hashes
+
+
+def extend_known_hashes(path, before, reference, dedup="row"):
+    """Fold rows appended to `path` (which `before`, an os.stat_result, describes) into its hash cache."""
+    hashes = _load_hashes(path, reference, dedup, before)
+    if hashes is None:
+        return  # No cache of the file before the append; known_hashes() rebuilds it when needed
+    header = read_header(path)
+    with open(path, newline='', encoding='utf-8') as f:  # The appended rows were written by pandas, in UTF-8
+        f.seek(before.st_size)
+        tail = pd.read_csv(f, header=None, names=header, dtype=object)
+    mapping = map_header(header, reference)[0]
+    _save_hashes(path, reference, dedup, np.union1d(hashes, _hash_rows([tail], mapping, reference, dedup)))
+
+
+def clean(path, out_path, quarantine_path=QUARANTINE_FILE, report_path=REPORT_FILE, reference=None, known=(),
+          dedup="row", chunksize=50000, max_bad_fraction=MAX_BAD_FRACTION):
+    """Validate `path` chunk by chunk into `out_path` and `quarantine_path`. Returns the report dict."""
+    start = time.perf_counter()
+    encoding = detect_encoding(path)
+    header = read_header(path, encoding)
+    reference = read_header(reference) if reference else header
+    mapping, unexpected, missing = map_header(header, reference)
+    features, name_column = _reference_columns(reference)
+    if not any(mapping.get(col) in features for col in header):
+        raise QualityError(f"{path}: no column matches a feature of the reference header")
+
+    labels = [normalize_header(col) for col in features]
+    lo, hi = np.array([feature_range(col) for col in features], dtype=np.float64).T
+    positions = [reference.index(col) for col in features]
+    others = [i for i, col in enumerate(reference) if col not in features]
+    first = int(lo.min())
+    digits = np.array([str(v) for v in range(first, int(hi.max()) + 1)] + [""], dtype=object)  # Last one for NaN
+    seen = np.zeros(0, dtype=np.uint64)  # Sorted hashes of the rows kept (and of the known files)
+    for known_path in known:
+        seen = np.union1d(seen, known_hashes(known_path, reference, dedup, chunksize))
+
+    report = {
+        "input": path, "encoding": encoding, "rows": 0, "clean": 0, "quarantined": 0,
+        "reasons": {}, "columns": {}, "dedup": dedup,
+        "renamed": {col: ref for col, ref in mapping.items() if col != ref},
+        "unexpected_columns": unexpected, "missing_columns": missing,
+    }
+    reasons = report["reasons"]
+    bad_lines = []
+    with open(out_path, 'w', newline='', encoding='utf-8') as out, \
+            open(quarantine_path, 'w', newline='', encoding='utf-8') as quarantine:
+        writer = csv.writer(quarantine)
+        writer.writerow(["reason"] + header)
+        pd.DataFrame(columns=reference).to_csv(out, index=False)
+        rows_out = csv.writer(out, lineterminator=os.linesep)  # The row format pandas' to_csv writes
+        for chunk in _read(path, encoding, chunksize, bad_lines):
+            frame, values, present = _parse(chunk, mapping, reference, features)
+            n = len(frame)
+            number = values.to_numpy()
+            nan = np.isnan(number)
+            # Every check over the whole answer block at once, (rows, features, checks)
+            masks = np.stack([present & nan, ~nan & (number % 1 != 0), (number < lo) | (number > hi)], axis=2)
+            for j, col in enumerate(features):
+                stats = report["columns"].setdefault(labels[j], dict.fromkeys(("missing",) + CHECKS, 0))
+                stats["missing"] += int((~present[:, j]).sum())
+                for k, check in enumerate(CHECKS):
+                    stats[check] += int(masks[:, j, k].sum())
+            reason = np.full(n, "", dtype=object)
+            rows, cols, kinds = np.nonzero(masks)  # In row, then feature, then check order
+            for i, j, k in zip(rows, cols, kinds):
+                reason[i] += f"{CHECKS[k]}:{labels[j]};"
+            reason[nan.all(axis=1) & (reason == "")] = "no_answers;"
+
+            # Duplicates among the valid rows: of this chunk (first one kept) and of everything kept before
+            hashes, named = _row_hashes(frame, values, dedup, name_column)
+            valid = reason == ""
+            repeated = _contains(seen, hashes)
+            repeated[valid] |= pd.Series(hashes[valid]).duplicated().to_numpy()
+            if dedup == "name":
+                repeated &= named  # Nameless rows cannot be matched by name
+            reason = np.where(valid & repeated, "duplicate;", reason)
+            keep = reason == ""
+            kept = np.sort(hashes[keep])  # New to `seen` and distinct, so they merge in without a re-sort
+            seen = np.insert(seen, np.searchsorted(seen, kept), kept)
+
+            cleaned = frame[keep].to_numpy(dtype=object)
+            # Kept answers are whole and inside their range, so each prints by table lookup (NaN as an empty field)
+            answers = np.where(nan[keep], len(digits) - 1 + first, number[keep]).astype(np.int64) - first
+            cleaned[:, positions] = digits[answers]
+            text = cleaned[:, others]
+            text[pd.isna(text)] = ""
+            cleaned[:, others] = text
+            rows_out.writerows(cleaned.tolist())
+            for row, why in zip(chunk[~keep].itertuples(index=False), reason[~keep]):
+                writer.writerow([why.rstrip(";")] + ["" if v != v else v for v in row])
+                for kind in {part.split(":")[0] for part in why.rstrip(";").split(";")}:
+                    reasons[kind] = reasons.get(kind, 0) + 1  # Rows per kind of problem
+            for fields in bad_lines:
+                writer.writerow(["malformed"] + fields)
+            if bad_lines:
+                reasons["malformed"] = reasons.get("malformed", 0) + len(bad_lines)
+            report["rows"] += n + len(bad_lines)
+            report["clean"] += int(keep.sum())
+            report["quarantined"] += int((~keep).sum()) + len(bad_lines)
+            bad_lines.clear()
+
+    report["columns"] = {col: {k: v for k, v in stats.items() if v} for col, stats in report["columns"].items()
+                         if any(stats.values())}
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report["rows"] and report["quarantined"] / report["rows"] > max_bad_fraction:
+        raise QualityError(f"{path}: {report['quarantined']} of {report['rows']} rows quarantined "
+                           f"(more than {max_bad_fraction:.0%}), see {quarantine_path}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate and clean a questionnaire export before training.")
+    parser.add_argument("data", help="CSV export to check")
+    parser.add_argument("out", help="Where the clean rows are written")
+    parser.add_argument("--quarantine", default=QUARANTINE_FILE, help="CSV of the rejected rows and their reasons")
+    parser.add_argument("--report", default=REPORT_FILE)
+    parser.add_argument("--reference", default=None, help="CSV whose header the output uses (default: the input's own)")
+    parser.add_argument("--known", nargs="*", default=[], help="CSVs whose rows count as already seen")
+    parser.add_argument("--dedup", choices=["row", "name"], default="row", help="Duplicate key: name and answers, or name alone")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--max-bad-fraction", type=float, default=MAX_BAD_FRACTION)
+    args = parser.parse_args()
+
+    try:
+        report = clean(args.data, args.out, args.quarantine, args.report, args.reference, args.known,
+                       args.dedup, args.chunksize, args.max_bad_fraction)
+    except QualityError as exc:
+        raise SystemExit(str(exc))
+    print(f"{report['clean']} of {report['rows']} rows clean, {report['quarantined']} quarantined "
+          f"({report['encoding']}, {report['seconds']}s)")
+    for reason, count in sorted(report["reasons"].items()):
+        print(f"  {reason:<14} {count}")
@@ -0,0 +1,180 @@
+# responses.py
+# Durable store of the questionnaires submitted on the compatibility page.
+#
+# Submissions are queued in memory and written by one background thread in batched
+# SQLite transactions (WAL), so the Streamlit thread never waits on disk. Answers are
+# stored as JSON keyed by the training column names, which lets export() write a CSV
+# with exactly the header of the training export:
+#
+#   python responses.py export new_responses.csv                  # submissions only
+#   python responses.py export training.csv --include-dataset     # training export + submissions
+#   python friend.py --data training.csv
+#
+# Set MATCHMINDS_RESPONSES=0 to stop storing submissions.
+import argparse
+import atexit
+import csv
+import json
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+
+RESPONSES_DB = "responses.sqlite"
+ENABLED = os.environ.get("MATCHMINDS_RESPONSES", "1") != "0"
+BATCH_SIZE = 256  # Rows per transaction
+FLUSH_INTERVAL = 1.0  # Seconds a submission may wait before it is written
+MAX_PENDING = 10_000  # Submissions held in memory; beyond that new ones are dropped and counted
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY,
+    submitted_at REAL NOT NULL,
+    name TEXT,
+    answers TEXT NOT NULL,
+    cluster INTEGER,
+    model_version TEXT
+)
+"""
+
+
+def connect(path=RESPONSES_DB):
+    db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")  # Survives process crashes; a power loss may drop the last batch
+    db.execute(SCHEMA)
+    return db
+
+
+class ResponseWriter:
+    """Queue of submissions drained into SQLite by a daemon thread."""
+
+    def __init__(self, path=RESPONSES_DB, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue(maxsize=MAX_PENDING)
+        self.written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="response-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, name, features, values, cluster=None, model_version=None):
+        """Queue one submission (answers in training feature order, NaN = unanswered); never blocks."""
+        answers = {f: float(v) for f, v in zip(features, values) if v == v}
+        row = (time.time(), name, json.dumps(answers), None if cluster is None else int(cluster), model_version)
+        try:
+            self.pending.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        db = connect(self.path)
+        while True:
+            batch = [self.pending.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.pending.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            if rows:
+                with db:  # One transaction per batch
+                    db.executemany("INSERT INTO responses (submitted_at, name, answers, cluster, model_version) "
+                                   "VALUES (?, ?, ?, ?, ?)", rows)
+                self.written += len(rows)
+            for _ in batch:
+                self.pending.task_done()
+            if None in batch:
+                db.close()
+                return
+
+    def flush(self):
+        """Block until everything submitted so far is written."""
+        self.pending.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self.pending.put(None)  # Stop marker: written batch first, then the thread exits
+            self._thread.join(timeout=10)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(path=RESPONSES_DB):
+    """The process-wide writer (the Streamlit pages rerun, so it is created once), or None if disabled."""
+    global _writer
+    if not ENABLED:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ResponseWriter(path)
+    return _writer
+
+
+def _format(value):
+    if value is None:
+        return ""
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def export(out_path, db_path=RESPONSES_DB, dataset=None, include_dataset=False, since=None, name_column='Full Name '):
+    """Write the stored submissions as CSV rows with the training export's header. Returns the row count."""
+    import friend
+
+    dataset = dataset or friend.DATASET
+    with open(dataset, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    if include_dataset:
+        shutil.copyfile(dataset, out_path)
+        with open(out_path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")  # Appended rows must start on their own line
+    db = connect(db_path)
+    count = 0
+    try:
+        with open(out_path, 'a' if include_dataset else 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if not include_dataset:
+                writer.writerow(header)
+            cursor = db.execute("SELECT name, answers FROM responses WHERE submitted_at >= ? ORDER BY id", (since or 0,))
+            while True:
+                rows = cursor.fetchmany(10_000)  # Constant memory regardless of the store size
+                if not rows:
+                    break
+                for name, answers in rows:
+                    answers = json.loads(answers)
+                    answers[name_column] = name
+                    writer.writerow([answers[col] if col == name_column else _format(answers.get(col)) for col in header])
+                count += len(rows)
+    finally:
+        db.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored questionnaire submissions for training.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="Write the submissions as a CSV friend.py can train from")
+    exp.add_argument("out", help="CSV to write")
+    exp.add_argument("--db", default=RESPONSES_DB)
+    exp.add_argument("--include-dataset", action="store_true", help="Start from a copy of the training export")
+    exp.add_argument("--since", type=float, default=None, help="Only submissions after this Unix time")
+    sub.add_parser("stats", help="Print the number of stored submissions").add_argument("--db", default=RESPONSES_DB)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        n = export(args.out, args.db, include_dataset=args.include_dataset, since=args.since)
+        print(f"Exported {n} submissions to {args.out}")
+    else:
+        db = connect(args.db)
+        total, first, last = db.execute("SELECT COUNT(*), MIN(submitted_at), MAX(submitted_at) FROM responses").fetchone()
+        print(json.dumps({"responses": total, "first": first, "last": last}))
@@ -0,0 +1,103 @@
+# schema.py
+# Compiled feature schema: one fixed vector slot per model feature, and the question bank keyed the same way.
+#
+# The CSV headers, expected_features.json and questionnaire.csv spell features with
+# different case and spacing ('  Openness To Experience', 'Hanging Out With friends',
+# 'use ofsocial media'). friend.py compiles them once into feature_schema.json using a
+# single key (whitespace collapsed, lower case) and fails the training run if a
+# question does not match a feature. At scoring time answers are written straight
+# into a preallocated row in training feature order, so a misspelled name raises
+# instead of silently becoming 0.
+import json
+from types import MappingProxyType
+
+import numpy as np
+
+from member_table import normalize_header
+
+SCHEMA_FILE = 'feature_schema.json'
+QUESTIONNAIRE = 'questionnaire.csv'
+
+
+def feature_key(name):
+    """The one spelling used to match feature names across files."""
+    return normalize_header(name).lower()
+
+
+def read_questionnaire(path=QUESTIONNAIRE, encoding=None):
+    """Parse questionnaire.csv into {feature key: {"question", "options", "labels"}} (encoding detected if not given)."""
+    import pandas as pd  # Only needed when compiling; serving loads feature_schema.json
+    from quality import detect_encoding
+
+    questions_df = pd.read_csv(path, encoding=encoding or detect_encoding(path))
+    has_options = "Options" in questions_df.columns
+    has_labels = "Labels" in questions_df.columns
+    questions = {}
+    for i, feature in enumerate(questions_df["Feature"].astype(str)):
+        questions[feature_key(feature)] = {
+            "question": str(questions_df["Question"].iat[i]).strip(),
+            "options": [opt.strip() for opt in str(questions_df["Options"].iat[i]).split(",")] if has_options else [],
+            "labels": [int(label.strip()) for label in str(questions_df["Labels"].iat[i]).split(",")] if has_labels else [],
+        }
+    return questions
+
+
+class FeatureSchema:
+    def __init__(self, features, questions):
+        self.features = tuple(features)  # Training column names, in vector order
+        self.keys = tuple(feature_key(f) for f in self.features)
+        self.slots = MappingProxyType({key: i for i, key in enumerate(self.keys)})
+        self.questions = MappingProxyType({
+            key: MappingProxyType({"question": q["question"], "options": tuple(q["options"]), "labels": tuple(q["labels"])})
+            for key, q in questions.items()
+        })
+
+    @classmethod
+    def compile(cls, features, questionnaire=QUESTIONNAIRE):
+        """Match every question to a feature slot; raises ValueError on any mismatch."""
+        questions = read_questionnaire(questionnaire)
+        keys = {feature_key(f) for f in features}
+        unmatched = sorted(set(questions) - keys)
+        if unmatched:
+            raise ValueError(f"questions without a matching feature: {unmatched}")
+        for key, q in questions.items():
+            if len(q["options"]) != len(q["labels"]):
+                raise ValueError(f"question '{key}' has {len(q['options'])} options but {len(q['labels'])} labels")
+        return cls(features, questions)
+
+    def save(self, path=SCHEMA_FILE):
+        with open(path, 'w') as f:
+            json.dump({"features": list(self.features),
+                       "questions": {k: {"question": q["question"], "options": list(q["options"]), "labels": list(q["labels"])}
+                                     for k, q in self.questions.items()}}, f, indent=2)
+
+    @classmethod
+    def load(cls, path=SCHEMA_FILE):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["features"], data["questions"])
+
+    def __len__(self):
+        return len(self.features)
+
+    def vector(self, answers, out=None):
+        """Write {feature name: answer} into a row in training order; unanswered slots stay NaN."""
+        row = np.full(len(self.features), np.nan) if out is None else out
+        for name, value in answers.items():
+            slot = self.slots.get(feature_key(name))
+            if slot is None:
+                raise ValueError(f"unknown feature: {name!r}")
+            row[slot] = value
+        return row
+
+    def matrix(self, rows):
+        """n x d matrix from answer dicts or from lists already in training order."""
+        out = np.full((len(rows), len(self.features)), np.nan)
+        for i, row in enumerate(rows):
+            if isinstance(row, dict):
+                self.vector(row, out[i])
+            elif len(row) == len(self.features):
+                out[i] = row
+            else:
+                raise ValueError(f"expected {len(self.features)} answers, got {len(row)}")
+        return out
@@ -0,0 +1,99 @@
+# scoring.py
+# Headless, vectorized compatibility scoring.
+#
+# compatibility = 0.6 * cosine(friend A, friend B) + 0.4 * cosine(centroid of A, centroid of B),
+# computed on the scaled feature vectors exactly like the compatibility check in test.py,
+# but for whole cohorts at once. Centroid-to-centroid similarities are a precomputed k x k
+# table, and top_k() streams the N x M matrix in row blocks so memory stays bounded.
+# Scaling and cluster assignment go through the AssignmentKernel (kernel.py) that was
+# checked against the sklearn models at training time, so the app, the scoring
+# service and batch scoring all assign with the same code.
+#
+#   python scoring.py cohort.csv --top-k 5 --out pairs.csv
+import argparse
+
+import numpy as np
+
+from kernel import AssignmentKernel, compatibility
+from neighbours import normalize_rows
+
+BLOCK_ROWS = 1024  # Rows of the score matrix held in memory at once by top_k()
+
+
+class Scorer:
+    """Cohort scoring on an AssignmentKernel: the kernel scales and assigns, the scorer ranks pairs."""
+
+    def __init__(self, kernel):
+        self.kernel = kernel
+        self.feature_names = kernel.feature_names
+        self.centroid_table = kernel.centroid_cosine  # k x k cosine
+
+    @classmethod
+    def from_models(cls, scaler, kmeans, centroid_table=None):
+        return cls(AssignmentKernel.from_models(scaler, kmeans, centroid_cosine=centroid_table))
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        return cls(artifacts.kernel)  # The kernel verified at training time (kernel.py)
+
+    def transform(self, values):
+        """Standardize raw answers (n x d, training feature order); missing values get the training mean."""
+        return self.kernel.transform(values)
+
+    def frame_values(self, df):
+        """Raw answers of a DataFrame with the training columns, NaN where unparsable."""
+        import pandas as pd
+        return df[self.feature_names].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+    def predict(self, values):
+        """Nearest centroid of every row of raw answers, same as KMeans.predict(scaler.transform(...))."""
+        return self.kernel.assign(values)
+
+    def matrix(self, a_values, b_values):
+        """Full len(a) x len(b) compatibility matrix of raw answers."""
+        a_scaled, b_scaled = self.transform(a_values), self.transform(b_values)
+        a_labels, b_labels = self.predict(a_values), self.predict(b_values)
+        friend_sim = normalize_rows(a_scaled) @ normalize_rows(b_scaled).T
+        return compatibility(friend_sim, self.centroid_table[np.ix_(a_labels, b_labels)])
+
+    def top_k(self, a_values, b_values, k=5, block_rows=BLOCK_ROWS, exclude_self=False):
+        """Yield (row offset, indices, scores) per block of `a`: the k best matches in `b` for every row."""
+        a_scaled, b_scaled = self.transform(a_values), self.transform(b_values)
+        a_labels, b_labels = self.predict(a_values), self.predict(b_values)
+        b_unit = normalize_rows(b_scaled)
+        k = min(k, len(b_labels) - (1 if exclude_self else 0))
+        for start in range(0, len(a_labels), block_rows):
+            stop = min(start + block_rows, len(a_labels))
+            friend_sim = normalize_rows(a_scaled[start:stop]) @ b_unit.T
+            scores = compatibility(friend_sim, self.centroid_table[np.ix_(a_labels[start:stop], b_labels)])
+            if exclude_self:
+                rows = np.arange(stop - start)
+                scores[rows, rows + start] = -np.inf
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind="stable")
+            yield start, np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    from artifacts import load_artifacts
+
+    parser = argparse.ArgumentParser(description="Score every respondent of a cohort against another (or itself).")
+    parser.add_argument("cohort", help="CSV with the training columns")
+    parser.add_argument("other", nargs="?", help="Second CSV; defaults to the first cohort, excluding self-matches")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--block-rows", type=int, default=BLOCK_ROWS)
+    parser.add_argument("--out", default="pairs.csv")
+    args = parser.parse_args()
+
+    scorer = Scorer.from_artifacts(load_artifacts())
+    a = pd.read_csv(args.cohort)
+    b = pd.read_csv(args.other) if args.other else a
+    a_values, b_values = scorer.frame_values(a), scorer.frame_values(b)
+    for i, (start, idx, scores) in enumerate(scorer.top_k(a_values, b_values, args.top_k, args.block_rows, exclude_self=args.other is None)):
+        rows = np.repeat(np.arange(start, start + len(idx)), idx.shape[1])
+        pd.DataFrame({"row": rows, "match": idx.ravel(), "rank": np.tile(np.arange(1, idx.shape[1] + 1), len(idx)),
+                      "compatibility": scores.ravel()}).to_csv(args.out, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    print(f"Wrote top {args.top_k} matches for {len(a)} rows to {args.out}")
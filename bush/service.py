@@ -0,0 +1,227 @@
+# service.py
+# Headless scoring service: the model behind a small async HTTP/JSON API, with no Streamlit.
+#
+#   python service.py --port 8600
+#
+#   GET  /health
+#   GET  /stats
+#   GET  /metrics         Prometheus text (with MATCHMINDS_METRICS=1)
+#   POST /assign          {"answers": [row, ...]}                     -> {"clusters": [...]}
+#   POST /compatibility   {"a": [row, ...], "b": [row, ...]}          -> {"scores": [...]}  (pairwise a[i] with b[i])
+#   POST /suggestions     {"answers": [row, ...], "k": 5}  (k <= 50)  -> {"suggestions": [[{"name", "gender", "score"}, ...], ...]}
+#
+# A row is either a list of the raw answers in training feature order or an object keyed
+# by feature name (see schema.feature_key); missing answers get the training mean.
+# Requests for the same endpoint are micro-batched: rows arriving within a couple of
+# milliseconds are scored together in one vectorized call on a worker thread (NumPy
+# releases the GIL), so the event loop only parses and answers requests.
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from artifacts import load_artifacts, stats as artifact_stats
+from candidates import CandidateIndex
+from neighbours import MemberIndex
+
+MAX_BATCH = 256  # Rows per vectorized call
+MAX_WAIT = 0.002  # Seconds a batch waits for more rows
+MAX_BODY = 1 << 20  # Larger request bodies get 413 and the connection is closed unread
+MAX_K = 50  # Most suggestions per row
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _rows(artifacts, rows):
+    """Raw answers as an n x d float matrix in training feature order."""
+    try:
+        return artifacts.schema.matrix(rows)
+    except (ValueError, TypeError, AttributeError) as exc:
+        raise BadRequest(str(exc))
+
+
+def assign_batch(rows):
+    artifacts = load_artifacts()
+    return artifacts.kernel.assign(_rows(artifacts, rows)).tolist()  # Folded float32 kernel (kernel.py)
+
+
+def compatibility_batch(pairs):
+    artifacts = load_artifacts()
+    _, _, scores = artifacts.kernel.score_pairs(_rows(artifacts, [p[0] for p in pairs]), _rows(artifacts, [p[1] for p in pairs]))
+    return [round(float(s), 6) for s in scores]
+
+
+def suggestions_batch(requests):
+    artifacts = load_artifacts()
+    index = artifacts.derived("candidates", CandidateIndex.from_artifacts)
+    members = artifacts.derived("neighbours", MemberIndex.from_artifacts)
+    values = _rows(artifacts, [r[0] for r in requests])
+    scaled, labels = artifacts.kernel.transform(values), artifacts.kernel.assign(values)
+    results = []
+    for vector, cluster, (_, k) in zip(scaled, labels, requests):
+        rows = index.cluster_rows(int(cluster))
+        rows = rows[index.has_name[rows]]
+        top, scores = members.rank(vector, rows, k=k)
+        results.append([{"name": index.names[r], "gender": index.genders[r], "score": round(float(s), 6)}
+                        for r, s in zip(top, scores)])
+    return results
+
+
+class MicroBatcher:
+    """Collects single items from many requests and scores them with one call."""
+
+    def __init__(self, fn, executor, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.fn = fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue()
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, items):
+        """Score a request's items; they may share a batch with other requests."""
+        futures = []
+        for item in items:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((item, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    def _timed(self, items):
+        with metrics.stage(f"service:{self.fn.__name__}"):
+            return self.fn(items)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self._timed, items)
+            except Exception:
+                results = None  # e.g. one bad row: score each item on its own so only its request fails
+            if results is None:
+                for item, future in batch:
+                    try:
+                        result = (await loop.run_in_executor(self.executor, self.fn, [item]))[0]
+                        future.set_result(result)
+                    except Exception as exc:
+                        future.set_exception(exc)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+
+class ScoringService:
+    def __init__(self, workers=4, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.batchers = {
+            "/assign": MicroBatcher(assign_batch, self.executor, max_batch, max_wait),
+            "/compatibility": MicroBatcher(compatibility_batch, self.executor, max_batch, max_wait),
+            "/suggestions": MicroBatcher(suggestions_batch, self.executor, max_batch, max_wait),
+        }
+        self.started = time.time()
+        self.requests = 0
+
+    async def handle(self, method, path, body):
+        if method == "GET" and path == "/health":
+            # load_artifacts() may check file stamps or load a new bundle, so keep it off the event loop
+            artifacts = await asyncio.get_running_loop().run_in_executor(self.executor, load_artifacts)
+            return 200, {"status": "ok", "version": artifacts.version}
+        if method == "GET" and path == "/stats":
+            return 200, {"uptime": time.time() - self.started, "requests": self.requests,
+                         "batches": {p: {"batches": b.batches, "items": b.items} for p, b in self.batchers.items()},
+                         "artifacts": artifact_stats()}
+        if method == "GET" and path == "/metrics":
+            return 200, metrics.render_prometheus()
+        if method != "POST" or path not in self.batchers:
+            return 404, {"error": f"no route for {method} {path}"}
+        try:
+            payload = json.loads(body or b"{}")
+            if path == "/assign":
+                return 200, {"clusters": await self.batchers[path].submit(payload["answers"])}
+            if path == "/compatibility":
+                if len(payload["a"]) != len(payload["b"]):
+                    raise BadRequest("'a' and 'b' must have the same length")
+                return 200, {"scores": await self.batchers[path].submit(list(zip(payload["a"], payload["b"])))}
+            k = int(payload.get("k", 5))
+            if not 1 <= k <= MAX_K:
+                raise BadRequest(f"'k' must be between 1 and {MAX_K}")
+            return 200, {"suggestions": await self.batchers[path].submit([(row, k) for row in payload["answers"]])}
+        except (BadRequest, KeyError, TypeError, ValueError) as exc:
+            return 400, {"error": str(exc)}
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                close = headers.get("connection", "").lower() == "close"
+                if length > MAX_BODY:
+                    status, result = 413, {"error": "request body too large"}
+                    close = True  # The body is never read, so the connection cannot be reused
+                else:
+                    status, result = await self.handle(method, path, await reader.readexactly(length) if length else b"")
+                self.requests += 1
+                if isinstance(result, str):
+                    data, content_type = result.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(result).encode(), "application/json"
+                head = (f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                        f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n")
+                if close:
+                    head += "Connection: close\r\n"
+                writer.write((head + "\r\n").encode() + data)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        load_artifacts()  # Load the model before accepting traffic
+        for batcher in self.batchers.values():
+            asyncio.ensure_future(batcher.run())
+        server = await asyncio.start_server(self.serve_connection, host, port)
+        print(f"Scoring service listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve cluster assignment, compatibility and suggestions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=4, help="Threads running the vectorized scoring")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000)
+    args = parser.parse_args()
+    asyncio.run(ScoringService(args.workers, args.max_batch, args.max_wait_ms / 1000).serve(args.host, args.port))
@@ -1,5 +1,13 @@
+import hashlib
+
 import streamlit as st
-import pandas as pd
+import numpy as np
+
+from artifacts import load_artifacts
+from candidates import CandidateIndex, format_traits_as_sentence
+from neighbours import MemberIndex
+import metrics
+from suggestion_cache import SuggestionCache, seed_for, suggestion_key
 
 def suggestion_page():
     st.set_page_config(layout="wide")
@@ -32,11 +40,10 @@ def suggestion_page():
         </p>
     """, unsafe_allow_html=True)
 
-    df = pd.read_csv("clustered_friends.csv")
-    df = df.dropna(subset=['Full Name '])
-    df['Full Name '] = df['Full Name '].astype(str).str.strip()
-    df['Name_clean'] = df['Full Name '].str.lower()
-    df['Cluster'] = df['Cluster'].astype(int)
+    with metrics.stage("artifacts"):
+        artifacts = load_artifacts()
+        index = artifacts.derived("candidates", CandidateIndex.from_artifacts)  # Shared candidate index
+        cache = artifacts.derived("suggestion_cache", SuggestionCache.from_artifacts)  # Emptied with every model reload
 
     f1_cluster = int(st.session_state.friend1_cluster)
     f2_cluster = int(st.session_state.friend2_cluster)
@@ -56,74 +63,70 @@ def suggestion_page():
     </div>
     """, unsafe_allow_html=True)
 
+    ranking = st.radio("Show", ["Random picks", "Most similar"], horizontal=True, key="suggestion_ranking")
+
     col1, spacer, col2 = st.columns([5, 1, 5])
 
-    traits_list_1 = ['Openness To Experience', 'Honesty', 'Loyalty', 'Respect', 'Family Values']
-    traits_list_2 = ['Open Mindedness', 'Listening Music', 'Reading Books', 'Cooking and Baking', 'Traveling']
+    traits_list_1 = ['Openness To Experience', 'Honesty', 'Loyality', 'Respect', 'Family Values']
+    traits_list_2 = ['Open Mindedness', 'Listen Music', 'Reading Books', 'Cooking and Baking', 'Traveling']
 
-    toggle = hash(friend1_name + friend2_name) % 2 == 0
+    toggle = int(hashlib.sha256((friend1_name + friend2_name).encode()).hexdigest(), 16) % 2 == 0  # Same in every process
 
     friend1_traits = traits_list_1 if toggle else traits_list_2
     friend2_traits = traits_list_2 if toggle else traits_list_1
 
-    threshold = 3
-
-    def format_traits_as_sentence(row, traits):
-        matched_traits = []
-        for trait in traits:
-            if trait in row and pd.notna(row[trait]) and float(row[trait]) > threshold:
-                matched_traits.append(trait.lower())
-        if matched_traits:
-            if len(matched_traits) == 1:
-                return f"You both have {matched_traits[0]}."
-            else:
-                return "You both have " + ", ".join(matched_traits[:-1]) + f", and {matched_traits[-1]}."
-        else:
-            return ""
-
-    def has_significant_traits(row, traits, threshold=3):
-        for trait in traits:
-            if trait in row and pd.notna(row[trait]) and float(row[trait]) > threshold:
-                return True
-        return False
-
-    def display_suggestions(column, friend_name, friend_cluster, traits):
+    def display_suggestions(column, friend_name, friend_cluster, traits, vector=None):
         column.markdown(f"<h4 style='text-align:center; color:#2E8B57;'>Suggestions for {friend_name.title()}</h4>", unsafe_allow_html=True)
 
-        suggestions = df[(df['Cluster'] == friend_cluster)]
-        suggestions = suggestions[~suggestions['Name_clean'].isin([friend_name])]
-
-        # Filter only friends with significant shared traits
-        filtered = suggestions[suggestions.apply(lambda row: has_significant_traits(row, traits), axis=1)]
-
-        if filtered.empty:
+        def compute():
+            # Members of the same cluster with significant shared traits
+            with metrics.stage("suggest:filter"):
+                filtered = index.candidates(friend_cluster, traits, exclude_name=friend_name)
+            with metrics.stage("suggest:rank"):
+                if len(filtered) == 0:
+                    return {"rows": [], "scores": None}
+                if ranking == "Most similar" and vector is not None:
+                    member_index = artifacts.derived("neighbours", MemberIndex.from_artifacts)
+                    rows, scores = member_index.rank(vector, filtered, k=5)  # Top 5 by cosine similarity
+                    return {"rows": [int(r) for r in rows], "scores": [float(s) for s in scores]}
+                rng = np.random.default_rng(seed_for(key))  # Seeded by the request: same picks on every rerun
+                rows = rng.choice(filtered, size=min(5, len(filtered)), replace=False)
+                return {"rows": [int(r) for r in rows], "scores": None}
+
+        # Same answers, cluster, traits, mode and model version -> same (cached) suggestions
+        key = suggestion_key(artifacts.version, friend_cluster, vector, traits, ranking, friend_name)
+        result = cache.get_or_compute(key, compute)
+        sample, scores = result["rows"], result["scores"]
+
+        if len(sample) == 0:
             column.info("No suitable friends found in this cluster.")
         else:
-            sample = filtered.sample(min(5, len(filtered)))
-            for idx, row in sample.iterrows():
-                avatar_index = idx % 100
-                gender = str(row['Gender']).strip().lower()
+            for i, row in enumerate(sample):
+                avatar_index = row % 100
+                gender = str(index.genders[row]).strip().lower()
                 avatar_url = avatar_male.format(avatar_index) if gender == 'male' else avatar_female.format(avatar_index)
 
-                traits_sentence = format_traits_as_sentence(row, traits)
+                traits_sentence = format_traits_as_sentence(index.matched_traits(row, traits))
+                similarity = f"<p style='margin:0; color:#2E8B57;'>Similarity: {scores[i] * 100:.0f}%</p>" if scores is not None else ""
 
                 column.markdown(
                     f"""
                     <div class="suggestion-card" style="display:flex; align-items:center;">
                         <img src="{avatar_url}" width="60" height="60">
                         <div>
-                            <p style="margin:0; font-weight:bold; font-size:18px; color:#4B0082;">{row['Full Name ']}</p>
-                            <p style="margin:0; color:#777;">Gender: {row['Gender']}</p>
+                            <p style="margin:0; font-weight:bold; font-size:18px; color:#4B0082;">{index.names[row]}</p>
+                            <p style="margin:0; color:#777;">Gender: {index.genders[row]}</p>
+                            {similarity}
                             <p style="margin-top: 8px; color:#555; font-size:15px; font-style: italic;">{traits_sentence}</p>
                         </div>
                     </div>
                     """, unsafe_allow_html=True)
 
     with col1:
-        display_suggestions(col1, friend1_name, f1_cluster, friend1_traits)
+        display_suggestions(col1, friend1_name, f1_cluster, friend1_traits, st.session_state.get("friend1_vector"))
 
     with col2:
-        display_suggestions(col2, friend2_name, f2_cluster, friend2_traits)
+        display_suggestions(col2, friend2_name, f2_cluster, friend2_traits, st.session_state.get("friend2_vector"))
 
     st.markdown("<br>", unsafe_allow_html=True)
     if st.button("⬅️ Back to Compatibility Check"):
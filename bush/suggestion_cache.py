@@ -0,0 +1,117 @@
+# suggestion_cache.py
+# Deterministic, cached suggestion results.
+#
+# A suggestion list is a pure function of the friend's scaled answers, cluster,
+# traits, ranking mode and the model version: the key is a SHA-256 of those and the
+# "Random picks" mode draws from a generator seeded with it, so every rerun, replica
+# and back-button visit shows the same members. Results are kept in a bounded
+# in-process LRU with a TTL, created per artifact version through
+# Artifacts.derived(), so a model reload starts from an empty cache. Set
+# MATCHMINDS_SUGGESTION_DB to a SQLite file to share results between the processes
+# of a host; shared rows carry the version in their key and simply expire.
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_ENTRIES = 10_000
+TTL = float(os.environ.get("MATCHMINDS_SUGGESTION_TTL", 3600))  # Seconds
+SHARED_DB = os.environ.get("MATCHMINDS_SUGGESTION_DB")
+
+
+def suggestion_key(version, cluster, vector, traits, ranking, exclude_name=""):
+    """Stable hex key of one suggestion request (no per-process hash randomization)."""
+    h = hashlib.sha256()
+    h.update(f"{version}|{int(cluster)}|{ranking}|{exclude_name.strip().lower()}|{'|'.join(traits)}|".encode())
+    if vector is not None:
+        h.update(np.round(np.asarray(vector, dtype=np.float64), 6).tobytes())  # Insensitive to float noise
+    return h.hexdigest()
+
+
+def seed_for(key):
+    """Random generator seed derived from a suggestion key."""
+    return int(key[:16], 16)
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._items = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+class SQLiteCache:
+    """Cache shared by the processes of one host, values stored as JSON."""
+
+    def __init__(self, path, ttl=TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS suggestions (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+        self._db.execute("DELETE FROM suggestions WHERE expires < ?", (time.time(),))
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM suggestions WHERE key = ? AND expires >= ?", (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO suggestions VALUES (?, ?, ?)", (key, json.dumps(value), time.time() + self.ttl))
+
+
+class SuggestionCache:
+    """In-process LRU in front of an optional shared SQLite cache."""
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+
+    @classmethod
+    def from_artifacts(cls, artifacts):
+        """A fresh cache for one artifact version (used through Artifacts.derived)."""
+        return cls(TTLCache(), SQLiteCache(SHARED_DB) if SHARED_DB else None)
+
+    def get_or_compute(self, key, compute):
+        """Cached value of `key`, computing and storing it on a miss. Values must be JSON-serializable."""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.put(key, value)
+        if value is None:
+            value = compute()
+            self.local.put(key, value)
+            if self.shared is not None:
+                self.shared.put(key, value)
+        return value
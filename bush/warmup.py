@@ -0,0 +1,89 @@
+# warmup.py
+# Background warm-up of the page modules, model artifacts and derived indexes.
+#
+# Streamlit runs app.py for the first time when the first session (or readiness probe)
+# connects, and then reruns it on every interaction. start() is guarded at module level,
+# so only that first run starts one daemon thread; it imports the page modules, loads the
+# artifacts and builds the scorer and suggestion indexes while the welcome page is being
+# served, instead of inside the first user's click. Set MATCHMINDS_WARMUP=0 to disable it.
+#
+#   python warmup.py     # cold-start report: every step timed in a fresh process
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import metrics
+
+ENABLED = os.environ.get("MATCHMINDS_WARMUP", "1") != "0"
+
+logger = logging.getLogger("matchminds.warmup")
+_lock = threading.Lock()
+_thread = None
+_report = {}  # step -> seconds, filled in as the warm-up runs
+done = threading.Event()
+
+
+def _step(name, fn):
+    start = time.perf_counter()
+    fn()
+    _report[name] = time.perf_counter() - start
+    metrics.observe(f"warmup:{name}", _report[name])
+
+
+def warm(base_dir="."):
+    """Run every warm-up step in the calling thread."""
+    from artifacts import load_artifacts
+
+    try:
+        _step("import:pages", lambda: (__import__("test"), __import__("suggestion")))
+        _step("load_artifacts", lambda: load_artifacts(base_dir))
+
+        from candidates import CandidateIndex
+        from neighbours import MemberIndex
+        from scoring import Scorer
+
+        artifacts = load_artifacts(base_dir)
+        _step("derived:scorer", lambda: artifacts.derived("scorer", Scorer.from_artifacts))
+        _step("derived:candidates", lambda: artifacts.derived("candidates", CandidateIndex.from_artifacts))
+        _step("derived:neighbours", lambda: artifacts.derived("neighbours", MemberIndex.from_artifacts))
+    except Exception:
+        logger.exception("warm-up failed; the pages will load everything on first use")
+    finally:
+        done.set()
+        logger.info("warm-up finished: %s", json.dumps(report()))
+
+
+def start(base_dir="."):
+    """Start the background warm-up once per process; later calls do nothing."""
+    global _thread
+    if not ENABLED or _thread is not None:
+        return
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=warm, args=(base_dir,), name="warmup", daemon=True)
+            _thread.start()
+
+
+def report():
+    """Seconds per warm-up step, and which heavy libraries ended up imported."""
+    return {
+        "steps": dict(_report),
+        "total_seconds": sum(_report.values()),
+        "done": done.is_set(),
+        "imported": {name: name in sys.modules for name in ("pandas", "joblib", "sklearn")},
+    }
+
+
+if __name__ == "__main__":
+    start_time = time.perf_counter()
+    _step("import:streamlit", lambda: __import__("streamlit"))
+    warm()
+    result = report()
+    result["process_seconds"] = time.perf_counter() - start_time
+    for name, seconds in result["steps"].items():
+        print(f"{name:<22} {seconds * 1000:>9.1f} ms")
+    print(f"{'total':<22} {result['process_seconds'] * 1000:>9.1f} ms")
+    print("heavy imports:", ", ".join(f"{k}={'yes' if v else 'no'}" for k, v in result["imported"].items()))
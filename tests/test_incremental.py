@@ -0,0 +1,178 @@
+import json
+import os
+import shutil
+import sys
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+BUSH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bush")
+sys.path.insert(0, BUSH)
+
+import bundle  # noqa: E402
+import friend  # noqa: E402
+import incremental  # noqa: E402
+import quality  # noqa: E402
+
+
+def synthetic_export(path, rows, seed):
+    """Rows shaped like the real export: three groups of respondents around different answers."""
+    header = list(pd.read_csv(os.path.join(BUSH, friend.DATASET), nrows=0).columns)
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({col: rng.integers(0, 2, rows) for col in header[3:]})
+    group = rng.integers(0, 3, rows)
+    for col in header[3:10]:
+        df[col] = np.clip(1 + 2 * group + rng.integers(0, 2, rows), 1, 5)
+    df.insert(0, header[2], np.where(group == 1, "Female", "Male"))
+    df.insert(0, header[1], rng.integers(18, 30, rows))
+    df.insert(0, header[0], [f"Member {seed}-{i}" for i in range(rows)])
+    df.to_csv(path, index=False)
+
+
+@pytest.fixture
+def streamed(tmp_path, monkeypatch):
+    shutil.copyfile(os.path.join(BUSH, "questionnaire.csv"), tmp_path / "questionnaire.csv")
+    monkeypatch.chdir(tmp_path)
+    dataset = str(tmp_path / "train.csv")
+    synthetic_export(dataset, 5000, seed=1)
+    out_dir = tmp_path / "model"
+    out_dir.mkdir()
+    friend.train(dataset, str(out_dir), streaming=True, k=3, chunksize=1000, quiet=True)
+    return dataset, str(out_dir)
+
+
+def test_state_covers_every_training_row(streamed):
+    dataset, out_dir = streamed
+    kmeans = joblib.load(os.path.join(out_dir, "kmeans_model.joblib"))
+    scaler = joblib.load(os.path.join(out_dir, "scaler.joblib"))
+    state = incremental.load_state(kmeans, scaler, out_dir)
+    assert sum(state["counts"]) == 5000
+
+    df = pd.read_csv(os.path.join(out_dir, "clustered_friends.csv"))
+    features = list(scaler.feature_names_in_)
+    scaled = friend.impute_and_scale(df, features, scaler.mean_, scaler.scale_)
+    msd = ((scaled - kmeans.cluster_centers_[df["Cluster"]]) ** 2).sum(axis=1).mean()
+    assert state["baseline_msd"] == pytest.approx(msd)
+
+
+def test_ingest_after_streaming_training(streamed, tmp_path):
+    dataset, out_dir = streamed
+    new_rows = str(tmp_path / "new.csv")
+    synthetic_export(new_rows, 200, seed=2)
+
+    summary = incremental.ingest(new_rows, dataset, out_dir)
+    assert summary["rows"] == 200
+    assert not summary["refit"]
+    assert abs(summary["drift"]) < incremental.DRIFT_THRESHOLD
+
+    kmeans = joblib.load(os.path.join(out_dir, "kmeans_model.joblib"))
+    scaler = joblib.load(os.path.join(out_dir, "scaler.joblib"))
+    assert sum(incremental.load_state(kmeans, scaler, out_dir)["counts"]) == 5200
+
+
+def snapshot(paths):
+    out = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            out[path] = f.read()
+    return out
+
+
+def test_failed_update_is_rolled_back_and_retried(streamed, tmp_path, monkeypatch):
+    dataset, out_dir = streamed
+    new_rows = str(tmp_path / "new.csv")
+    synthetic_export(new_rows, 200, seed=2)
+    table = os.path.join(out_dir, "member_table")
+    files = [dataset, os.path.join(out_dir, "clustered_friends.csv"), os.path.join(out_dir, "kmeans_model.joblib"),
+             os.path.join(out_dir, "cluster_summary.npz")] + [os.path.join(table, name) for name in os.listdir(table)]
+    before = snapshot(files)
+
+    def broken_export(*args, **kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as m:
+        m.setattr(incremental, "export_kernel", broken_export)
+        with pytest.raises(OSError):
+            incremental.ingest(new_rows, dataset, out_dir)
+    assert snapshot(files) == before
+
+    # The retry, against the same directory, adds the rows exactly once
+    summary = incremental.ingest(new_rows, dataset, out_dir)
+    assert summary["rows"] == 200
+    assert len(pd.read_csv(dataset)) == 5200
+    assert len(pd.read_csv(os.path.join(out_dir, "clustered_friends.csv"))) == 5200
+    assert len(incremental.MemberTable.open(table)) == 5200
+
+
+def test_refit_replaces_the_model(streamed, tmp_path):
+    dataset, out_dir = streamed
+    new_rows = str(tmp_path / "new.csv")
+    synthetic_export(new_rows, 200, seed=2)
+    summary = incremental.ingest(new_rows, dataset, out_dir, drift_threshold=-1.0)
+    assert summary["refit"]
+    assert len(incremental.MemberTable.open(os.path.join(out_dir, "member_table"))) == 5200
+    assert not [name for name in os.listdir(out_dir) if name.startswith(".refit-")]
+
+
+def test_dedup_hashes_follow_the_appended_rows(streamed, tmp_path, monkeypatch):
+    dataset, out_dir = streamed
+    first, second = str(tmp_path / "first.csv"), str(tmp_path / "second.csv")
+    synthetic_export(first, 200, seed=2)
+    synthetic_export(second, 100, seed=3)
+    assert incremental.ingest(first, dataset, out_dir)["rows"] == 200
+
+    read, detect = quality._read, quality.detect_encoding
+
+    def only_new(fn):
+        def wrapper(path, *args, **kwargs):
+            assert path == second, "known file rescanned"
+            return fn(path, *args, **kwargs)
+        return wrapper
+
+    with monkeypatch.context() as m:
+        m.setattr(quality, "_read", only_new(read))
+        m.setattr(quality, "detect_encoding", only_new(detect))
+        assert incremental.ingest(second, dataset, out_dir)["rows"] == 100
+    with pytest.raises(quality.QualityError, match="200 of 200 rows quarantined"):
+        incremental.ingest(first, dataset, out_dir)  # Every row was added by the first ingest
+
+
+def test_staged_bundle_links_only_replaced_files(streamed, tmp_path):
+    dataset, out_dir = streamed
+    models = tmp_path / "models"
+    models.mkdir()
+    shutil.copytree(out_dir, models / "stage")
+    bundle.publish(str(models / "stage"), str(models))
+    current = bundle.current_dir(str(models))
+    with bundle.staged(str(models), from_current=True, copied=incremental.APPENDED_FILES) as stage:
+        for rel in ("scaler.joblib", "member_table/meta.json", "clustered_friends.csv", "member_table/features.i8"):
+            linked = os.path.samefile(os.path.join(stage, rel), os.path.join(current, rel))
+            assert linked == (rel not in incremental.APPENDED_FILES)
+        new_rows = str(tmp_path / "new.csv")
+        synthetic_export(new_rows, 200, seed=2)
+        incremental.ingest(new_rows, dataset, stage)
+        bundle.publish(stage, str(models))
+    bundle.validate(current)  # The previous bundle is untouched
+
+
+def test_published_bundle_requires_its_kernel(streamed, tmp_path):
+    dataset, out_dir = streamed
+    models = tmp_path / "models"
+    models.mkdir()
+    shutil.copytree(out_dir, models / "stage")
+    os.remove(models / "stage" / incremental.KERNEL_FILE)
+    with pytest.raises(bundle.BundleError, match="has no kernel.npz"):
+        bundle.publish(str(models / "stage"), str(models))
+
+    shutil.copyfile(os.path.join(out_dir, incremental.KERNEL_FILE), models / "stage" / incremental.KERNEL_FILE)
+    current = os.path.join(str(models), bundle.publish(str(models / "stage"), str(models)))
+    manifest_path = os.path.join(current, bundle.MANIFEST)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    del manifest["files"][incremental.KERNEL_FILE]
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    with pytest.raises(bundle.BundleError, match="no kernel.npz"):
+        bundle.validate(current)